@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Teams rejects bot messages over about 28KB, and shows at most 6 buttons or actions on a card
+TEAMS_MAX_ACTIVITY_BYTES = int(os.environ.get("teams_max_activity_bytes", "28000"))
+TEAMS_MAX_CARD_BUTTONS = int(os.environ.get("teams_max_card_buttons", "6"))
+
+_PLACEHOLDER = re.compile(r'"@(\w+)@"')
+
+
+class CardLimitError(ValueError):
+    """
+    Raised by validate when an activity is over a Teams limit that trimming cannot fix, so it is not sent
+    only to be rejected
+    """
+
+
+class Activity:
+    """
+    A Teams activity serialized once from its template. body holds the JSON bytes posted to the connector.
+    """
+    __slots__ = ("kind", "body", "buttons")
+
+    def __init__(self, kind, body, buttons=0):
+        self.kind = kind
+        self.body = body
+        self.buttons = buttons
+
+    def to_dict(self):
+        return json.loads(self.body)
+
+    def __str__(self):
+        return self.body.decode("utf-8")
+
+
+class Template:
+    """
+    An activity serialized ahead of time with "@field@" placeholders. Rendering only encodes the field values
+    and joins them with the prebuilt fragments; the nested dicts are never rebuilt.
+    """
+
+    def __init__(self, kind, skeleton):
+        self.kind = kind
+        parts = _PLACEHOLDER.split(json.dumps(skeleton, separators=(",", ":")))
+        self.fragments = [part.encode("utf-8") for part in parts[0::2]]
+        self.fields = parts[1::2]
+
+    def render(self, **values):
+        chunks = [self.fragments[0]]
+        for field, fragment in zip(self.fields, self.fragments[1:]):
+            chunks.append(dumps(values[field]))
+            chunks.append(fragment)
+        return Activity(self.kind, b"".join(chunks), len(values.get("buttons", ())))
+
+
+TEXT_TEMPLATE = Template("text", {"type": "message", "text": "@text@"})
+
+HERO_CARD_TEMPLATE = Template("hero_card", {
+    "type": "message",
+    "attachments": [{
+        "contentType": "application/vnd.microsoft.card.hero",
+        "content": {"text": "@text@", "buttons": "@buttons@"}
+    }]
+})
+
+FILE_CONSENT_TEMPLATE = Template("file_consent", {
+    "type": "message",
+    "attachments": [{
+        "contentType": "application/vnd.microsoft.teams.card.file.consent",
+        "name": "@name@",
+        "content": {
+            "description": "Consent",
+            "sizeInBytes": "@size@",
+            "acceptContext": {},
+            "declineContext": {}
+        }
+    }]
+})
+
+IMAGE_TEMPLATE = Template("image", {
+    "type": "message",
+    "text": "",
+    "attachments": [{"contentType": "image/png", "contentUrl": "@url@", "name": "@name@"}]
+})
+
+ADAPTIVE_CARD_TEMPLATE = Template("adaptive_card", {
+    "type": "message",
+    "text": "",
+    "attachments": [{
+        "contentType": "application/vnd.microsoft.card.adaptive",
+        "content": {
+            "type": "AdaptiveCard",
+            "version": "1.0",
+            "body": [{"type": "TextBlock", "text": "@text@", "separation": "none"}],
+            "actions": [{"type": "Action.OpenUrl", "url": "@url@", "title": "@title@"}]
+        }
+    }]
+})
+
+
+def dumps(value):
+    """
+    Serializes the value to JSON bytes with orjson when it is installed, else with the standard library
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def validate(activity):
+    """
+    Returns the JSON body of an Activity, or of an activity dict such as a dead-lettered one,
+    after checking it against the Teams size and button limits
+    """
+    if isinstance(activity, Activity):
+        body, kind, buttons = activity.body, activity.kind, activity.buttons
+    else:
+        body, kind, buttons = dumps(activity), "message", 0
+    if len(body) > TEAMS_MAX_ACTIVITY_BYTES:
+        raise CardLimitError(f"The {kind} activity is {len(body)} bytes, over the {TEAMS_MAX_ACTIVITY_BYTES} "
+                             f"byte limit")
+    if buttons > TEAMS_MAX_CARD_BUTTONS:
+        raise CardLimitError(f"The {kind} activity has {buttons} buttons, over the limit of {TEAMS_MAX_CARD_BUTTONS}")
+    return body
+
+
+def as_dict(activity):
+    return activity.to_dict() if isinstance(activity, Activity) else activity
+
+
+def message_activity(message):
+    return TEXT_TEMPLATE.render(text=message)
+
+
+def trim_buttons(item_list):
+    """
+    Returns the first TEAMS_MAX_CARD_BUTTONS buttons, so a card with too many is still delivered
+    """
+    if len(item_list) <= TEAMS_MAX_CARD_BUTTONS:
+        return item_list
+    logger.info(f"Card has {len(item_list)} buttons, sending the first {TEAMS_MAX_CARD_BUTTONS}")
+    return item_list[:TEAMS_MAX_CARD_BUTTONS]
+
+
+def button_activity(item_list, message):
+    return HERO_CARD_TEMPLATE.render(text=message, buttons=trim_buttons(item_list))
+
+
+def consent_activity(title, image_size):
+    return FILE_CONSENT_TEMPLATE.render(name=title, size=image_size)
+
+
+def image_activity(image_url, image_title):
+    return IMAGE_TEMPLATE.render(url=image_url, name=image_title)
+
+
+def adaptive_card_activity(message, url, title="Click here"):
+    return ADAPTIVE_CARD_TEMPLATE.render(text=message, url=url, title=title)
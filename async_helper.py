@@ -0,0 +1,92 @@
+import asyncio
+import json
+import logging
+import threading
+import executor_helper
+import http_helper
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RETRY_STATUSES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Each thread keeps its event loop and aiohttp session for the warm container,
+# so connections stay open between invocations
+_local = threading.local()
+
+
+class AsyncResponse:
+    """
+    The parts of a requests.Response the helpers use, filled from either HTTP client
+    """
+
+    def __init__(self, status_code, text, retries=0, headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.retries = retries
+        self.headers = CaseInsensitiveDict(headers or {})
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def run(coroutine):
+    """
+    Runs the coroutine to completion on this thread's event loop
+    """
+    loop = getattr(_local, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _local.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coroutine)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Awaits a blocking call (boto3, the token cache) on the shared I/O pool, keeping the caller's context variables
+    """
+    return await asyncio.wrap_future(executor_helper.submit(func, *args, **kwargs))
+
+
+async def request(method, url, retry=True, **kwargs):
+    """
+    Sends the request with aiohttp when it is installed, otherwise through the pooled sync sessions on the I/O pool.
+    Idempotent methods are retried with the same bounded backoff as http_helper, unless retry is False.
+    """
+    if aiohttp is None:
+        response = await run_blocking(http_helper.request, method, url, retry, **kwargs)
+        return AsyncResponse(response.status_code, response.text, http_helper.retry_count(response), response.headers)
+
+    attempts = http_helper.MAX_RETRIES + 1 if retry and method.upper() in IDEMPOTENT_METHODS else 1
+    for attempt in range(attempts):
+        try:
+            response = await _aiohttp_request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                response.retries = attempt
+                return response
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt == attempts - 1:
+                raise
+        await asyncio.sleep(http_helper.BACKOFF_FACTOR * (2 ** attempt))
+
+
+async def _aiohttp_request(method, url, params=None, **kwargs):
+    if params:
+        params = {name: str(value) for name, value in params.items()}
+    timeout = aiohttp.ClientTimeout(sock_connect=http_helper.CONNECT_TIMEOUT, sock_read=http_helper.READ_TIMEOUT)
+    async with _get_session().request(method, url, params=params, timeout=timeout, **kwargs) as response:
+        return AsyncResponse(response.status, await response.text(), headers=response.headers)
+
+
+def _get_session():
+    session = getattr(_local, "session", None)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=http_helper.POOL_SIZE, keepalive_timeout=60)
+        session = _local.session = aiohttp.ClientSession(connector=connector)
+    return session
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import os
+import lambda_function
+from async_helper import run_blocking
+from db_helper import get_client_config
+from conversation_helper import conversation_context
+from haptik_helper import get_chat_transcripts_async
+from kendra_helper import search_kendra
+from teams_helper import post_activity_async
+from activity_builder import message_activity, button_activity, image_activity, trim_buttons
+from translation_helper import translation_context
+from write_buffer import buffered_writes
+from invoke_helper import batched_invokes
+from log_helper import verbose
+from sequence_helper import conversation_lease
+from tracing import current_trace_id
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+async def lambda_handler_async(event, context, conversation_id=None, client_config=None):
+    """
+    Async variant of lambda_handler. Teams and Haptik go through the async HTTP client;
+    DynamoDB, Lambda and Kendra calls are awaited on the shared I/O pool.
+    A conversation_id or client config the caller already looked up is not read again.
+    """
+    client_id = event.get("client_id")
+    itsm = event.get("itsm")
+    auth_id = event.get("user")
+    payload = event.get("body")
+    verbose("Event payload: %s", payload)
+    conversation_id, client_config = await asyncio.gather(
+        _look_up(conversation_id, lambda_function.get_conversation_id, auth_id),
+        _look_up(client_config, get_client_config, client_id))
+    if conversation_id is None:
+        logger.error(
+            f"Couldn't find the conversation_id for the given auth_id: {auth_id}")
+        return
+    if client_config is None:
+        logger.error(f"Items not found for the client: {client_id}")
+        return
+    creds = client_config.creds
+    translation = translation_context(client_config, auth_id, conversation_id)
+
+    event_name = payload.get('event_name', "")
+    is_automated = payload.get("agent", {}).get("is_automated")
+
+    # Only this event runs on the invocation's loop, so waiting for the lease inline blocks nothing else
+    with conversation_lease(conversation_id, current_trace_id()) as lease:
+        if lease is not None and lease.duplicate:
+            logger.info(f"Skipping event already processed for conversation: {conversation_id}")
+            return
+        with conversation_context(auth_id, conversation_id), buffered_writes(), batched_invokes():
+            if translation.enabled:
+                # The user's language comes with the conversation's mapping, which is read off the loop
+                await run_blocking(translation.load_language)
+            await handle_event_async(event_name, translation, creds, payload,
+                                     auth_id, is_automated, itsm, client_id, conversation_id, client_config)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps('Hello from Lambda!')
+    }
+
+
+async def _look_up(value, func, *args):
+    return value if value is not None else await run_blocking(func, *args)
+
+
+async def handle_event_async(event_name, translation, creds, payload, auth_id, is_automated, itsm, client_id,
+                             conversation_id, client_config=None):
+    """
+    Routes the event to the async handler registered for its exact event_name in ASYNC_EVENT_HANDLERS
+    """
+    handler = ASYNC_EVENT_HANDLERS.get(event_name)
+    if handler is None:
+        logger.info(f"Received Unsupported event: {event_name}")
+        return
+    await handler(translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id,
+                  client_config)
+
+
+async def route_resolution_event_async(translation, creds, payload, auth_id, is_automated, itsm, client_id,
+                                       conversation_id, client_config):
+    logger.info("Received Conversation completed event")
+    await handle_resolution_event_async(translation, creds, payload,
+                                        auth_id, is_automated, itsm, client_id, conversation_id)
+
+
+async def route_message_event_async(translation, creds, payload, auth_id, is_automated, itsm, client_id,
+                                    conversation_id, client_config):
+    logger.info("Received Message event")
+    if lambda_function.apply_termination_rule(payload, client_config):
+        logger.info(
+            "Handling Ticket termination based on message received")
+        await handle_message_event_async(translation, creds, payload,
+                                         auth_id, conversation_id, itsm, client_id)
+        await handle_resolution_event_async(translation, creds, payload,
+                                            auth_id, is_automated, itsm, client_id, conversation_id)
+    else:
+        await handle_message_event_async(translation, creds, payload,
+                                         auth_id, conversation_id, itsm, client_id)
+
+
+async def route_pinned_event_async(translation, creds, payload, auth_id, is_automated, itsm, client_id,
+                                   conversation_id, client_config):
+    logger.info("Received Chat Pinned event")
+    await handle_pinned_event_async(translation, creds, payload,
+                                    auth_id, conversation_id)
+
+
+async def handle_pinned_event_async(translation, creds, payload, auth_id, conversation_id):
+    try:
+        agent_name = payload.get("agent", {}).get("name").title()
+    except AttributeError:
+        agent_name = "IT Agent"
+    message = f"----- *{agent_name} has entered the conversation* -----"
+
+    if translation.active:
+        message = await run_blocking(translation.translate, message)
+    lambda_function.update_attributes(lambda_function.user_mapping_table,
+                                      {"con_id": conversation_id}, {"agent_name": agent_name})
+    if await post_activity_async(creds, conversation_id, message_activity(message)) is not None:
+        await run_blocking(lambda_function.store_message_in_DB, message, conversation_id, agent_name)
+
+
+async def handle_message_event_async(translation, creds, payload, auth_id, conversation_id, itsm, client_id):
+    logger.info("Handling Message event")
+    message = payload.get("message", {}).get("body", {}).get("text", "")
+    message_type = payload.get("message", {}).get("body", {}).get("type", "")
+    user_mapping = await run_blocking(lambda_function.get_user_mapping, conversation_id)
+    email = user_mapping.get("user_email")
+    query = user_mapping.get("latest_message")
+    try:
+        agent_name = payload.get("agent", {}).get("name").title()
+    except AttributeError:
+        agent_name = "BOT"
+
+    item_list = []
+    if 'BOT BREAK' in message or payload.get("message", {}).get("body", {}).get("data", {}).get("intents"):
+        item_list = lambda_function.build_disambiguation_items(payload)
+        return await handle_kendra_search_async(item_list, query, creds, conversation_id, agent_name,
+                                                translation)
+
+    message_type_handler = ASYNC_MESSAGE_TYPE_HANDLERS.get(message_type)
+    if message_type_handler:
+        prepared = await message_type_handler(payload, message, creds, conversation_id, agent_name,
+                                              itsm, auth_id, client_id, email)
+        if prepared is None:
+            return
+        item_list, message = prepared
+    item_list = trim_buttons(item_list)
+    if translation.active:
+        if item_list:
+            message = await run_blocking(translation.translate_card, message, item_list)
+        else:
+            message = await run_blocking(translation.translate, message)
+    if item_list:
+        sent = await post_activity_async(creds, conversation_id, button_activity(item_list, message))
+    else:
+        sent = await post_activity_async(creds, conversation_id, message_activity(message))
+    if sent is not None:
+        await run_blocking(lambda_function.store_message_in_DB, message, conversation_id, agent_name)
+
+
+async def handle_button_message_async(payload, message, creds, conversation_id, agent_name, itsm, auth_id,
+                                     client_id, email):
+    # The attachment writes and ticket invokes are buffered, so the sync handler does not block the loop
+    return lambda_function.handle_button_message(payload, message, creds, conversation_id, agent_name,
+                                                 itsm, auth_id, client_id, email)
+
+
+async def handle_carousel_message_async(payload, message, creds, conversation_id, agent_name, itsm, auth_id,
+                                       client_id, email):
+    images = lambda_function.collect_carousel_images(payload)
+    for img_url, title in images:
+        lambda_function.ticket_attachment_invoke(
+            "png", itsm, auth_id, conversation_id, client_id, email, title, img_url)
+    for img_url, title in images:
+        if await post_activity_async(creds, conversation_id, image_activity(img_url, title)) is not None:
+            await run_blocking(lambda_function.store_message_in_DB, "IMAGE", conversation_id, agent_name)
+
+
+async def handle_resolution_event_async(translation, creds, payload, auth_id, is_automated, itsm, client_id,
+                                        conversation_id):
+    user_name = payload.get("user", {}).get("user_name")
+    conversation_number = payload.get("data", {}).get("conversation_no")
+    try:
+        agent_name = payload.get("agent", {}).get("name").title()
+    except AttributeError:
+        agent_name = "BOT"
+
+    async def send_completion_notice():
+        message = "----- *This conversation is marked as completed* -----"
+        if translation.active:
+            message = await run_blocking(translation.translate, message)
+        if await post_activity_async(creds, conversation_id, message_activity(message)) is not None:
+            await run_blocking(lambda_function.store_message_in_DB, message, conversation_id, agent_name)
+
+    async def fetch_transcript():
+        # As in the sync handler, a failed fetch sends the ticket without the transcript
+        try:
+            return await get_chat_transcripts_async(creds, user_name, conversation_number)
+        except Exception as ex:
+            logger.error(f"Exception raised while fetching the chat transcript: {ex}")
+            return None
+
+    # Both are awaited before any error is raised, so neither is left pending on the loop for the next invocation
+    results = await asyncio.gather(fetch_transcript(), send_completion_notice(), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    chat_transcript = results[0]
+    ticket_data = lambda_function.resolution_ticket_data(itsm, client_id, conversation_id, chat_transcript,
+                                                         is_automated)
+    verbose("Data being passed to ticketing function is: %s", ticket_data)
+    lambda_function.invoke_async(os.environ.get("ticketing_handler_arn"), ticket_data)
+
+
+async def handle_kendra_search_async(item_list, query, creds, conversation_id, agent_name, translation=None):
+    message, links = await run_blocking(search_kendra, query)
+    new_list = lambda_function.build_kendra_items(item_list, links)
+    if translation is not None and translation.active:
+        message = await run_blocking(translation.translate_card, message, new_list)
+    if await post_activity_async(creds, conversation_id, button_activity(new_list, message)) is not None:
+        await run_blocking(lambda_function.store_message_in_DB, message, conversation_id, agent_name)
+
+
+ASYNC_EVENT_HANDLERS = {
+    "message": route_message_event_async,
+    "chat_pinned": route_pinned_event_async,
+    "webhook_conversation_complete": route_resolution_event_async
+}
+
+ASYNC_MESSAGE_TYPE_HANDLERS = {
+    "BUTTON": handle_button_message_async,
+    "CAROUSEL": handle_carousel_message_async
+}
@@ -0,0 +1,89 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# One proxy per client, resource and table for the whole container, shared by every module
+_proxies = {}
+_registry_lock = threading.RLock()
+# Seconds spent building each client, resource and table, for cold-start measurements
+build_times = {}
+
+
+class LazyClient:
+    """
+    Stands in for a boto3 client, resource or Table and builds it on first attribute access.
+    boto3 itself is only imported when the first of them is built.
+    """
+
+    def __init__(self, name, factory):
+        self._name = name
+        self._factory = factory
+        self._target = None
+
+    def __getattr__(self, attribute):
+        return getattr(self._resolve(), attribute)
+
+    @property
+    def resolved(self):
+        return self._target is not None
+
+    def set_factory(self, factory):
+        """
+        Replaces how the object is built, e.g. with a local stand-in. Drops an object that was already built.
+        """
+        with _registry_lock:
+            self._factory = factory
+            self._target = None
+
+    def _resolve(self):
+        target = self._target
+        if target is None:
+            with _registry_lock:
+                if self._target is None:
+                    start = time.perf_counter()
+                    self._target = self._factory()
+                    build_times[self._name] = time.perf_counter() - start
+                    logger.debug(f"Built {self._name} in {build_times[self._name] * 1000:.1f}ms")
+                target = self._target
+        return target
+
+
+def client(service_name):
+    return _get_proxy(f"client:{service_name}", lambda: _boto3().client(service_name))
+
+
+def resource(service_name):
+    return _get_proxy(f"resource:{service_name}", lambda: _boto3().resource(service_name))
+
+
+def table(env_name):
+    """
+    Returns the DynamoDB Table whose name is configured in the env_name environment variable.
+    The variable is read when the table is first used.
+    """
+    return _get_proxy(f"table:{env_name}", lambda: resource("dynamodb").Table(os.environ.get(env_name)))
+
+
+def resolved_names():
+    """
+    Returns the names of the clients, resources and tables built so far
+    """
+    with _registry_lock:
+        return sorted(name for name, proxy in _proxies.items() if proxy.resolved)
+
+
+def _get_proxy(name, factory):
+    proxy = _proxies.get(name)
+    if proxy is None:
+        with _registry_lock:
+            proxy = _proxies.setdefault(name, LazyClient(name, factory))
+    return proxy
+
+
+def _boto3():
+    import boto3
+    return boto3
@@ -0,0 +1,88 @@
+import json
+import logging
+from collections import OrderedDict
+import lambda_function
+from db_helper import get_client_config
+from executor_helper import map_concurrently, submit_batch
+from profiler import profile
+from tracing import trace
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+@profile
+def sqs_handler(event, context):
+    """
+    Entry point for an SQS batch of outbound events, each record body holding one lambda_handler event.
+    Records of the same client and user (one Teams conversation) are processed in the order of the batch;
+    conversations run in parallel. Order across batches and retries needs an SQS FIFO queue with the
+    conversation's con_id as MessageGroupId. Failed records are returned as batchItemFailures, which needs ReportBatchItemFailures
+    on the event source mapping.
+    """
+    records = event.get("Records", [])
+    failures = []
+    groups = OrderedDict()
+    for record in records:
+        try:
+            body = json.loads(record["body"])
+        except (KeyError, TypeError, ValueError) as ex:
+            logger.error(f"Exception raised while parsing the SQS record {record.get('messageId')}: {ex}")
+            failures.append(record.get("messageId"))
+            continue
+        groups.setdefault((body.get("client_id"), body.get("user")), []).append((record["messageId"], body))
+
+    # One client config read per client, shared by all its conversations
+    client_ids = list(OrderedDict.fromkeys(client_id for client_id, _ in groups))
+    client_configs = dict(zip(client_ids, map_concurrently(read_client_config, client_ids)))
+
+    futures = []
+    for (client_id, _), group in groups.items():
+        client_config = client_configs.get(client_id)
+        if isinstance(client_config, Exception):
+            # Only the records of the client whose config could not be read are retried
+            failures.extend(message_id for message_id, _ in group)
+            continue
+        if client_config is None:
+            # process_event would read client_mapping_table again for each record, only to drop it as well
+            logger.error(f"Items not found for the client: {client_id}, dropping {len(group)} records")
+            continue
+        futures.append(submit_batch(process_conversation, group, client_config))
+    for future in futures:
+        failures.extend(future.result())
+    logger.info(f"Processed {len(records)} records in {len(groups)} conversations, {len(failures)} failed")
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failures]}
+
+
+def read_client_config(client_id):
+    """
+    Returns the client's config, None when the client is unknown, or the exception raised while reading it
+    """
+    try:
+        return get_client_config(client_id)
+    except Exception as ex:
+        logger.error(f"Exception raised while reading the config of client {client_id}: {ex}")
+        return ex
+
+
+def process_conversation(group, client_config):
+    """
+    Processes the (message_id, event) pairs of one conversation in order and returns the ids of the failed ones.
+    After a failure the rest of the conversation is reported as failed too, so the retry keeps the order.
+    """
+    conversation_id = None
+    for index, (message_id, body) in enumerate(group):
+        try:
+            with trace(body.get("client_id"), message_id):
+                if conversation_id is None and body.get("body", {}).get("event_name") in lambda_function.EVENT_HANDLERS:
+                    conversation_id = lambda_function.get_conversation_id(body.get("user"))
+                    if conversation_id is None:
+                        # Every record of the group is for the same user, so none of them can be sent
+                        logger.error(f"Couldn't find the conversation_id for the given auth_id: {body.get('user')}, "
+                                     f"dropping {len(group) - index} records")
+                        return []
+                lambda_function.process_event(body, conversation_id=conversation_id, client_config=client_config)
+        except Exception as ex:
+            logger.error(f"Exception raised while processing the SQS record {message_id}: {ex}")
+            return [failed_id for failed_id, _ in group[index:]]
+    return []
@@ -0,0 +1,71 @@
+"""
+Feeds synthetic SQS batches of thousands of events through batch_handler.sqs_handler against local stand-ins,
+reports the throughput and checks that every conversation's messages were stored in the order they were queued.
+
+Run from the repo root: python -m benchmarks.batch_benchmark
+"""
+import logging
+import os
+import re
+import time
+from benchmarks.stubs import (EVENT_TYPES, add_conversation, configure_environment, install_stand_ins,
+                              sqs_record, start_stub_server, stub_routes, synthetic_event)
+
+configure_environment()
+# The per-event EMF records would drown the report; the container histograms still see every span
+os.environ.setdefault("trace_metrics", "false")
+server, base_url = start_stub_server(stub_routes(), latency=0.01)
+stand_ins = install_stand_ins(base_url, aws_latency=0.002)
+
+import batch_handler  # noqa: E402
+
+CONVERSATIONS = 200
+EVENTS_PER_CONVERSATION = 10
+MALFORMED_RECORDS = 5
+
+
+def build_batch(event_types):
+    """
+    Interleaves the conversations' events the way a busy queue would deliver them
+    """
+    records = []
+    for index in range(EVENTS_PER_CONVERSATION):
+        for conversation in range(CONVERSATIONS):
+            event_type = event_types[(conversation + index) % len(event_types)]
+            event = synthetic_event(event_type, f"user-{conversation}", index)
+            records.append(sqs_record(event, f"{event_type}-{conversation}-{index}"))
+    for index in range(MALFORMED_RECORDS):
+        records.append({"messageId": f"malformed-{index}", "body": "{not json"})
+    return records
+
+
+def check_order():
+    """
+    Returns the conversations whose "Message N" transcript lines are not in increasing N
+    """
+    lines = {}
+    for (con_id, seq), item in sorted(stand_ins["chat_transcript_table"].items.items()):
+        match = re.search(r"Message (\d+)$", item["line"])
+        if match:
+            lines.setdefault(con_id, []).append(int(match.group(1)))
+    return [con_id for con_id, numbers in lines.items() if numbers != sorted(numbers)]
+
+
+def run(name, event_types):
+    records = build_batch(event_types)
+    start = time.perf_counter()
+    response = batch_handler.sqs_handler({"Records": records}, None)
+    duration = time.perf_counter() - start
+    failures = len(response["batchItemFailures"])
+    print(f"{name:<10} {len(records):>7} records {duration:>7.2f}s {len(records) / duration:>8.0f} records/s "
+          f"{failures:>4} failed")
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    for conversation in range(CONVERSATIONS):
+        add_conversation(stand_ins, f"user-{conversation}", f"conversation-{conversation}")
+    run("messages", ("message",))
+    out_of_order = check_order()
+    print(f"conversations out of order: {len(out_of_order)}")
+    run("mixed", EVENT_TYPES)
@@ -0,0 +1,87 @@
+"""
+Cold-start cost per event type. Every event type runs in a fresh interpreter, which measures:
+- the import time of lambda_function,
+- the AWS clients, resources and tables the first event builds, and what building them really costs,
+- the time of the first event against local stand-ins, plus that real build cost.
+
+The eager column is what building every client at import time, as the handler used to, costs.
+
+Run from the repo root: python -m benchmarks.cold_start_benchmark
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+AWS_OBJECTS = {
+    "client:lambda": lambda boto3: boto3.client("lambda"),
+    "client:kendra": lambda boto3: boto3.client("kendra"),
+    "resource:dynamodb": lambda boto3: boto3.resource("dynamodb"),
+}
+
+
+def measure(event_type):
+    from benchmarks.stubs import (add_conversation, configure_environment, install_stand_ins, start_stub_server,
+                                  stub_routes, synthetic_event)
+    import logging
+    configure_environment()
+    # The event's EMF record would be printed before the result line the parent process reads
+    os.environ.setdefault("trace_metrics", "false")
+    start = time.perf_counter()
+    import lambda_function
+    import_time = time.perf_counter() - start
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server, base_url = start_stub_server(stub_routes())
+    stand_ins = install_stand_ins(base_url)
+    add_conversation(stand_ins, "cold-user", "cold-conversation")
+    import aws_helper
+    start = time.perf_counter()
+    lambda_function.lambda_handler(synthetic_event(event_type, "cold-user"), None)
+    first_event = time.perf_counter() - start
+    used = aws_helper.resolved_names()
+
+    # Build the real objects the event used to find out what they cost on a cold start
+    start = time.perf_counter()
+    import boto3
+    build = time.perf_counter() - start
+    needs_dynamodb = any(name.startswith("table:") for name in used)
+    for name, factory in AWS_OBJECTS.items():
+        if name in used or (name == "resource:dynamodb" and needs_dynamodb):
+            start = time.perf_counter()
+            factory(boto3)
+            build += time.perf_counter() - start
+    return {"import": import_time, "first_event": first_event + build, "build": build, "used": used}
+
+
+def measure_eager():
+    start = time.perf_counter()
+    import boto3
+    for factory in AWS_OBJECTS.values():
+        factory(boto3)
+    return time.perf_counter() - start
+
+
+def run_fresh(argument):
+    output = subprocess.run([sys.executable, "-m", "benchmarks.cold_start_benchmark", argument],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        from benchmarks.stubs import configure_environment
+        configure_environment()
+        result = measure_eager() if sys.argv[1] == "--eager" else measure(sys.argv[1])
+        print(json.dumps(result))
+        sys.exit(0)
+
+    from benchmarks.stubs import EVENT_TYPES
+    eager = run_fresh("--eager")
+    print(f"building every client eagerly: {eager * 1000:.1f}ms")
+    print(f"{'event type':<24} {'import':>9} {'client init':>12} {'first event':>12}  clients used")
+    for event_type in EVENT_TYPES:
+        result = run_fresh(event_type)
+        print(f"{event_type:<24} {result['import'] * 1000:>7.1f}ms {result['build'] * 1000:>10.1f}ms "
+              f"{result['first_event'] * 1000:>10.1f}ms  {', '.join(result['used'])}")
@@ -0,0 +1,181 @@
+"""
+Load test of lambda_handler against local stand-ins for every dependency: the Bot Framework connector, the token
+endpoint, Haptik, DynamoDB, Kendra and the translation and ticketing Lambdas, each with its own injected latency
+and error rate.
+
+Synthetic events of every type, or events recorded one JSON object per line (--events), are replayed at the
+target concurrency, one phase per event type and a final mixed phase. Each phase reports the throughput,
+p50/p95/p99 latency, the events that raised, the dependency errors the traces recorded and the outbound calls
+per event seen by the stand-ins, retries included.
+
+Sends to Teams are paced by teams_sender as in production, so teams_tenant_rate (50 activities/s) caps the
+throughput of the card-heavy types; set e.g. teams_tenant_rate=1000 to measure the handler alone.
+
+Run from the repo root: python -m benchmarks.load_test --concurrency 32 --error-rate 0.02
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from benchmarks.stubs import (EVENT_TYPES, add_conversation, configure_environment, install_stand_ins, percentile,
+                              start_stub_server, stub_routes, synthetic_event)
+
+# Outbound call counters read from the stand-ins: (name, stub server route or stand-in names)
+HTTP_DEPENDENCIES = (("teams", "/conversations/"), ("token", "/token"), ("haptik", "/haptik/"))
+AWS_DEPENDENCIES = (("dynamodb", ("client_mapping_table", "teams_reverse_mapping", "teams_mapping_table",
+                                  "chat_transcript_table")), ("lambda", ("lambda",)), ("kendra", ("kendra",)),
+                    ("s3", ("s3",)))
+DEPENDENCIES = tuple(name for name, _ in HTTP_DEPENDENCIES + AWS_DEPENDENCIES)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline load test of lambda_handler")
+    parser.add_argument("--concurrency", type=int, default=16, help="events in flight at once")
+    parser.add_argument("--events-per-type", type=int, default=200, help="synthetic events per event type")
+    parser.add_argument("--conversations", type=int, default=100, help="conversations the events rotate over")
+    parser.add_argument("--events", help="JSON lines file of recorded lambda_handler events to replay instead")
+    parser.add_argument("--pipeline-mode", choices=("sync", "async"), default="sync")
+    parser.add_argument("--http-latency-ms", type=float, default=20.0, help="Teams, token and Haptik latency")
+    parser.add_argument("--aws-latency-ms", type=float, default=5.0, help="DynamoDB, Lambda, Kendra and S3 latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="failure share of every stand-in")
+    parser.add_argument("--fault", action="append", default=[], metavar="NAME=LATENCY_MS:ERROR_RATE",
+                        help="overrides one stand-in, e.g. teams=200:0.05 or kendra=50:0; repeatable")
+    return parser.parse_args()
+
+
+def build_faults(args):
+    """
+    Returns the stub server's route faults and the AWS stand-ins' faults from the command line
+    """
+    defaults = {name: (args.http_latency_ms, args.error_rate) for name, _ in HTTP_DEPENDENCIES}
+    defaults.update({name: (args.aws_latency_ms, args.error_rate) for name, _ in AWS_DEPENDENCIES})
+    for override in args.fault:
+        name, _, values = override.partition("=")
+        latency_ms, _, error_rate = values.partition(":")
+        if name not in defaults:
+            raise SystemExit(f"Unknown stand-in {name}, expected one of {', '.join(defaults)}")
+        defaults[name] = (float(latency_ms), float(error_rate or 0.0))
+
+    def fault(name):
+        latency_ms, error_rate = defaults[name]
+        return {"latency": latency_ms / 1000, "error_rate": error_rate}
+
+    route_faults = {route: fault(name) for name, route in HTTP_DEPENDENCIES}
+    aws_faults = {stand_in: fault(name) for name, stand_ins in AWS_DEPENDENCIES for stand_in in stand_ins}
+    return route_faults, aws_faults
+
+
+def event_type(event):
+    """
+    Labels a recorded event by its event name, and message events by their message type
+    """
+    body = event.get("body", {})
+    if body.get("event_name") == "message":
+        return body.get("message", {}).get("body", {}).get("type", "TEXT").lower()
+    return body.get("event_name")
+
+
+def load_events(args, stand_ins):
+    """
+    Returns the events to replay grouped by event type, and maps every user of them to a conversation
+    """
+    if args.events:
+        grouped = {}
+        with open(args.events) as events_file:
+            for line in events_file:
+                if line.strip():
+                    event = json.loads(line)
+                    grouped.setdefault(event_type(event), []).append(event)
+    else:
+        # Each type starts at its own conversation so the mixed phase does not queue one type after another
+        # on the same conversation's lease
+        stride = max(1, args.conversations // len(EVENT_TYPES))
+        grouped = {name: [synthetic_event(name, f"load-user-{(index + offset * stride) % args.conversations}", index)
+                          for index in range(args.events_per_type)] for offset, name in enumerate(EVENT_TYPES)}
+    users = {event.get("user") for events in grouped.values() for event in events}
+    for index, user in enumerate(sorted(users, key=str)):
+        if (user,) not in stand_ins["teams_reverse_mapping"].items:
+            add_conversation(stand_ins, user, f"load-conversation-{index}")
+    for events in grouped.values():
+        for event in events:
+            event["pipeline_mode"] = args.pipeline_mode
+    return grouped
+
+
+def count_calls(server, stand_ins):
+    counts = {name: server.route_calls.get(route, 0) for name, route in HTTP_DEPENDENCIES}
+    for name, names in AWS_DEPENDENCIES:
+        counts[name] = 0
+        for stand_in in names:
+            calls = stand_ins[stand_in].calls
+            counts[name] += sum(calls.values()) if isinstance(calls, dict) else calls
+    return counts
+
+
+def count_dependency_errors(tracing):
+    return sum(histogram["errors"] for histogram in tracing.get_histograms().values())
+
+
+def replay(lambda_function, event):
+    """
+    Sends one event through lambda_handler and returns its latency in ms and whether it raised
+    """
+    context = SimpleNamespace(aws_request_id=uuid.uuid4().hex, function_name="load-test")
+    start = time.perf_counter()
+    try:
+        lambda_function.lambda_handler(json.loads(json.dumps(event)), context)
+        failed = False
+    except Exception:
+        failed = True
+    return (time.perf_counter() - start) * 1000, failed
+
+
+def run_phase(name, events, concurrency, server, stand_ins):
+    import lambda_function
+    import tracing
+    calls_before = count_calls(server, stand_ins)
+    errors_before = count_dependency_errors(tracing)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda event: replay(lambda_function, event), events))
+    duration = time.perf_counter() - start
+    calls_after = count_calls(server, stand_ins)
+    samples = [latency for latency, _ in results]
+    per_event = " ".join(f"{(calls_after[dependency] - calls_before[dependency]) / len(events):>8.2f}"
+                         for dependency in DEPENDENCIES)
+    print(f"{name:<24} {len(events):>6} {len(events) / duration:>8.1f}/s {percentile(samples, 50):>8.1f}ms "
+          f"{percentile(samples, 95):>8.1f}ms {percentile(samples, 99):>8.1f}ms "
+          f"{sum(failed for _, failed in results):>6} {count_dependency_errors(tracing) - errors_before:>7} "
+          f"{per_event}")
+
+
+def main():
+    args = parse_args()
+    configure_environment()
+    # The per-event EMF records would drown the report; the container histograms still see every span
+    os.environ.setdefault("trace_metrics", "false")
+    route_faults, aws_faults = build_faults(args)
+    server, base_url = start_stub_server(stub_routes(), faults=route_faults)
+    stand_ins = install_stand_ins(base_url, faults=aws_faults)
+    import lambda_function  # noqa: F401
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    grouped = load_events(args, stand_ins)
+    print(f"concurrency {args.concurrency}, {args.pipeline_mode} pipeline, "
+          f"{sum(len(events) for events in grouped.values())} events")
+    print(f"{'event type':<24} {'events':>6} {'throughput':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'raised':>6} "
+          f"{'dep err':>7} " + " ".join(f"{dependency:>8}" for dependency in DEPENDENCIES))
+    for name, events in grouped.items():
+        run_phase(name, events, args.concurrency, server, stand_ins)
+    # Interleaves the types the way live traffic arrives
+    mixed = [event for batch in zip(*grouped.values()) for event in batch]
+    if len(grouped) > 1 and mixed:
+        run_phase("mixed", mixed, args.concurrency, server, stand_ins)
+
+
+if __name__ == "__main__":
+    main()
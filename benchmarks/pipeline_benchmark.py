@@ -0,0 +1,47 @@
+"""
+p50/p99 latency of the sync and async pipelines of lambda_handler for each event type,
+against local stand-ins for Teams, the token endpoint, Haptik, DynamoDB, Lambda and Kendra.
+
+Run from the repo root: python -m benchmarks.pipeline_benchmark
+"""
+import copy
+import logging
+import os
+import time
+from benchmarks.stubs import (EVENT_TYPES, add_conversation, configure_environment, install_stand_ins, percentile,
+                              start_stub_server, stub_routes, synthetic_event)
+
+configure_environment()
+# The per-event EMF records would drown the report; the container histograms still see every span
+os.environ.setdefault("trace_metrics", "false")
+server, base_url = start_stub_server(stub_routes(), latency=0.02)
+stand_ins = install_stand_ins(base_url, aws_latency=0.005)
+
+import lambda_function  # noqa: E402
+
+EVENTS_PER_TYPE = 30
+# Events rotate over several conversations so Teams' per-conversation rate limit does not pace the benchmark
+CONVERSATIONS = 10
+
+
+def run(mode, event_type):
+    samples = []
+    for index in range(EVENTS_PER_TYPE):
+        event = copy.deepcopy(synthetic_event(event_type, f"bench-user-{index % CONVERSATIONS}", index))
+        event["pipeline_mode"] = mode
+        start = time.perf_counter()
+        lambda_function.lambda_handler(event, None)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    for conversation in range(CONVERSATIONS):
+        add_conversation(stand_ins, f"bench-user-{conversation}", f"bench-conversation-{conversation}")
+    print(f"{'event type':<24} {'sync p50':>10} {'sync p99':>10} {'async p50':>10} {'async p99':>10}")
+    for event_type in EVENT_TYPES:
+        sync = run("sync", event_type)
+        async_ = run("async", event_type)
+        print(f"{event_type:<24} {percentile(sync, 50):>8.1f}ms {percentile(sync, 99):>8.1f}ms "
+              f"{percentile(async_, 50):>8.1f}ms {percentile(async_, 99):>8.1f}ms")
@@ -0,0 +1,439 @@
+import io
+import json
+import os
+import random
+import socket
+import threading
+import time
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every request from the routes table of the server: path prefix -> (status, body).
+    A route listed in the server's faults answers with its own latency and fails its error_rate share with a 503.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; without TCP_NODELAY each response waits on a delayed ACK
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def _respond(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_body = self.rfile.read(length) if length else b""
+        status, body, matched = 404, {}, None
+        for prefix, route in self.server.routes.items():
+            if self.path.startswith(prefix):
+                (status, body), matched = route, prefix
+                break
+        if self.command == "POST":
+            with self.server.counter_lock:
+                self.server.posts.append((self.path, request_body))
+        fault = self.server.faults.get(matched, {})
+        time.sleep(fault.get("latency", self.server.latency))
+        if random.random() < fault.get("error_rate", 0.0):
+            status, body = 503, {"error": "injected failure"}
+        with self.server.counter_lock:
+            self.server.calls[self.path.split("?")[0]] = self.server.calls.get(self.path.split("?")[0], 0) + 1
+            self.server.route_calls[matched] = self.server.route_calls.get(matched, 0) + 1
+        # Large bodies can be given pre-encoded so serving them does not allocate in the measured process
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def configure_environment():
+    """
+    Sets the region and table names the modules read at import time. The tables are replaced by FakeTables.
+    """
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    for name in ("client_mapping_table", "teams_mapping_table", "teams_reverse_mapping", "chat_transcript_table"):
+        os.environ.setdefault(name, f"bench-{name}")
+
+
+def start_stub_server(routes, latency=0.0, faults=None):
+    """
+    Starts a local HTTP stand-in on a free port and returns the server and its base url.
+    faults maps a route prefix to {"latency": seconds, "error_rate": fraction} for that route.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.routes = routes
+    server.latency = latency
+    server.faults = faults or {}
+    server.calls = {}
+    server.route_calls = {}
+    # (path, body) of every POST in the order they arrived
+    server.posts = []
+    server.counter_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FakeTable:
+    """
+    In-memory stand-in for a boto3 DynamoDB Table. Items are copied through json on every call
+    so that, like the real service, the cost of a call grows with the size of the item it moves.
+    latency is added per call and latency_per_kb per KB of item data read or written; error_rate of the calls
+    fail with ProvisionedThroughputExceededException, as they would once botocore ran out of retries.
+    """
+
+    def __init__(self, key_names, latency=0.0, latency_per_kb=0.0, name="fake-table", error_rate=0.0):
+        self.name = name
+        self.key_names = key_names
+        self.latency = latency
+        self.latency_per_kb = latency_per_kb
+        self.error_rate = error_rate
+        self.items = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def _key(self, key):
+        return tuple(key[name] for name in self.key_names)
+
+    def _wire(self, operation, data):
+        encoded = json.dumps(data, default=str)
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        time.sleep(self.latency + self.latency_per_kb * len(encoded) / 1024)
+        if random.random() < self.error_rate:
+            raise _client_error("ProvisionedThroughputExceededException", operation)
+        return json.loads(encoded)
+
+    def get_item(self, Key, **kwargs):
+        with self.lock:
+            item = self.items.get(self._key(Key))
+        item = self._wire("get_item", item)
+        if item is None:
+            return {}
+        projection = kwargs.get("ProjectionExpression")
+        if projection:
+            names = [name.strip() for name in projection.split(",")]
+            item = {name: item[name] for name in names if name in item}
+        return {"Item": item}
+
+    def put_item(self, Item, **kwargs):
+        item = self._wire("put_item", Item)
+        with self.lock:
+            self.items[self._key(item)] = item
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        values = self._wire("delete_item", kwargs.get("ExpressionAttributeValues") or {})
+        with self.lock:
+            condition = kwargs.get("ConditionExpression")
+            if condition and not _evaluate_condition(condition, self.items.get(self._key(Key), {}), values):
+                raise _conditional_check_failed("DeleteItem")
+            self.items.pop(self._key(Key), None)
+        return {}
+
+    @property
+    def meta(self):
+        # The Table's client, which the shared cache tiers make their batch reads with
+        return SimpleNamespace(client=self)
+
+    def batch_get_item(self, RequestItems):
+        request = RequestItems[self.name]
+        with self.lock:
+            items = [self.items[self._key(key)] for key in request["Keys"] if self._key(key) in self.items]
+        items = self._wire("batch_get_item", items)
+        if request.get("ProjectionExpression"):
+            names = [name.strip() for name in request["ProjectionExpression"].split(",")]
+            items = [{name: item[name] for name in names if name in item} for item in items]
+        return {"Responses": {self.name: items}}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    **kwargs):
+        values = self._wire("update_item", ExpressionAttributeValues or {})
+        names = ExpressionAttributeNames or {}
+        action, _, assignments = UpdateExpression.partition(" ")
+        with self.lock:
+            current = self.items.get(self._key(Key), {})
+            condition = kwargs.get("ConditionExpression")
+            if condition and not _evaluate_condition(condition, current, values):
+                raise _conditional_check_failed("UpdateItem")
+            item = self.items.setdefault(self._key(Key), dict(Key))
+            for assignment in assignments.split(","):
+                if action.lower() == "remove":
+                    item.pop(names.get(assignment.strip(), assignment.strip()), None)
+                else:
+                    name, _, placeholder = assignment.partition("=")
+                    item[names.get(name.strip(), name.strip())] = values[placeholder.strip()]
+            if kwargs.get("ReturnValues") == "ALL_NEW":
+                return {"Attributes": json.loads(json.dumps(item, default=str))}
+        return {}
+
+    def query(self, **kwargs):
+        condition = kwargs["KeyConditionExpression"].get_expression()
+        partition_value = condition["values"][1]
+        with self.lock:
+            items = sorted((key, item) for key, item in self.items.items() if key[0] == partition_value)
+        return {"Items": self._wire("query", [item for _, item in items])}
+
+    def batch_writer(self, **kwargs):
+        return FakeBatchWriter(self)
+
+
+def _evaluate_condition(condition, item, values):
+    """
+    Evaluates the ConditionExpression subset the handler uses: attribute_exists(a), attribute_not_exists(a),
+    a = :v and a < :v, joined by OR or AND without parentheses
+    """
+    def term(text):
+        text = text.strip()
+        if text.startswith("attribute_not_exists("):
+            return text[len("attribute_not_exists("):-1].strip() not in item
+        if text.startswith("attribute_exists("):
+            return text[len("attribute_exists("):-1].strip() in item
+        for operator in ("<", "="):
+            name, found, placeholder = text.partition(operator)
+            if found:
+                if name.strip() not in item:
+                    return False
+                value = item[name.strip()]
+                expected = values[placeholder.strip()]
+                return value < expected if operator == "<" else value == expected
+        raise ValueError(f"Unsupported condition: {text}")
+    return any(all(term(part) for part in clause.split(" AND ")) for clause in condition.split(" OR "))
+
+
+def _conditional_check_failed(operation):
+    return _client_error("ConditionalCheckFailedException", operation, "The conditional request failed")
+
+
+def _client_error(code, operation, message="Injected failure"):
+    from botocore.exceptions import ClientError
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class FakeBatchWriter:
+
+    def __init__(self, table):
+        self.table = table
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def put_item(self, Item):
+        self.table.put_item(Item=Item)
+
+
+class FakeLambdaClient:
+    """
+    Stand-in for the boto3 Lambda client. RequestResponse invokes answer like the translation service;
+    error_rate of the invokes answer with an Unhandled FunctionError. invocations lists the
+    (FunctionName, InvocationType, payload) of every invoke once its latency has passed.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = {}
+        self.invocations = []
+        self.lock = threading.Lock()
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        with self.lock:
+            self.calls[InvocationType] = self.calls.get(InvocationType, 0) + 1
+        time.sleep(self.latency)
+        payload = json.loads(Payload)
+        with self.lock:
+            self.invocations.append((FunctionName, InvocationType, payload))
+        if random.random() < self.error_rate:
+            error = {"errorMessage": "Injected failure", "errorType": "Exception"}
+            return {"StatusCode": 200, "FunctionError": "Unhandled", "Payload": io.BytesIO(json.dumps(error).encode())}
+        body = {"translated_message": payload.get("message"), "translated_messages": payload.get("messages")}
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(body).encode())}
+
+
+class FakeKendra:
+    """
+    Stand-in for the boto3 Kendra client that answers with one ANSWER and two DOCUMENT results, and fails
+    error_rate of the queries with a ThrottlingException
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def query(self, QueryText, IndexId, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise _client_error("ThrottlingException", "Query")
+        return {"ResultItems": [
+            {"Type": "ANSWER", "DocumentExcerpt": {"Text": f"Answer for {QueryText}"},
+             "DocumentURI": "https://kb.example.com/answer", "ScoreAttributes": {"ScoreConfidence": "HIGH"}},
+            {"Type": "DOCUMENT", "DocumentExcerpt": {"Text": "First document"},
+             "DocumentURI": "https://kb.example.com/first", "ScoreAttributes": {"ScoreConfidence": "MEDIUM"}},
+            {"Type": "DOCUMENT", "DocumentExcerpt": {"Text": "Second document"},
+             "DocumentURI": "https://kb.example.com/second", "ScoreAttributes": {"ScoreConfidence": "LOW"}},
+        ]}
+
+
+class FakeS3:
+    """
+    Stand-in for the boto3 S3 client that keeps uploaded objects in memory, failing error_rate of the uploads
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.objects = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise _client_error("SlowDown", "PutObject")
+        data = Fileobj.read()
+        with self.lock:
+            self.objects[(Bucket, Key)] = (data, dict(ExtraArgs or {}))
+
+
+def install_stand_ins(base_url, aws_latency=0.0, faults=None):
+    """
+    Points every module of the handler at local stand-ins: the stub HTTP server at base_url for the token endpoint,
+    Teams and Haptik, FakeTables for DynamoDB and fake Lambda, Kendra and S3 clients.
+    faults maps a stand-in name to {"latency": seconds, "error_rate": fraction}; the others get aws_latency.
+    Must be called after configure_environment and before the first event. Returns the stand-ins by name.
+    """
+    faults = faults or {}
+
+    def fault(name):
+        return {"latency": aws_latency, **faults.get(name, {})}
+
+    os.environ["auth_token_url"] = f"{base_url}/token"
+    os.environ["ticketing_handler_arn"] = "bench-ticketing"
+    os.environ["translation_service_arn"] = "bench-translation"
+    os.environ.setdefault("transcript_offload_location", "s3://bench-transcripts/chat")
+    import aws_helper
+    import conversation_helper
+    import db_helper
+    import haptik_helper
+    import invoke_helper
+    import kendra_helper
+    import lambda_function
+    import transcript_helper
+    import translation_helper
+
+    haptik_helper.CHAT_HISTORY_URL = f"{base_url}/haptik/get_chat_history/"
+    client_table = FakeTable(["client_id"], name="client_mapping_table", **fault("client_mapping_table"))
+    client_table.items[("bench",)] = {
+        "client_id": "bench", "teams_base_url": base_url, "teams_client_id": "bench-client",
+        "teams_client_secret": "bench-secret", "teams_scope": "bench-scope", "bot_business": "1",
+        "bot_client_id": "bench-bot", "bot_chat_auth": "bench-auth", "is_translation": True
+    }
+    reverse_table = FakeTable(["auth_id"], name="teams_reverse_mapping", **fault("teams_reverse_mapping"))
+    user_table = FakeTable(["con_id"], name="teams_mapping_table", **fault("teams_mapping_table"))
+    transcript_table = FakeTable(["con_id", "seq"], name="chat_transcript_table", **fault("chat_transcript_table"))
+    lambda_client = FakeLambdaClient(**fault("lambda"))
+    kendra = FakeKendra(**fault("kendra"))
+    s3 = FakeS3(**fault("s3"))
+
+    _stand_in(db_helper, "client_mapping_table", client_table)
+    _stand_in(conversation_helper, "reverse_mapping_table", reverse_table)
+    _stand_in(lambda_function, "user_mapping_table", user_table)
+    _stand_in(transcript_helper, "user_mapping_table", user_table)
+    _stand_in(transcript_helper, "transcript_table", transcript_table)
+    _stand_in(invoke_helper, "lambda_client", lambda_client)
+    _stand_in(translation_helper, "lambda_client", lambda_client)
+    _stand_in(kendra_helper, "kendra", kendra)
+    aws_helper.client("s3").set_factory(lambda: s3)
+    return {
+        "client_mapping_table": client_table,
+        "teams_reverse_mapping": reverse_table,
+        "teams_mapping_table": user_table,
+        "chat_transcript_table": transcript_table,
+        "lambda": lambda_client,
+        "kendra": kendra,
+        "s3": s3,
+    }
+
+
+def _stand_in(module, name, fake):
+    # Lazy registry entries keep their identity so every module sharing them sees the fake, and their
+    # resolved flag still shows whether the event used them
+    current = getattr(module, name)
+    if hasattr(current, "set_factory"):
+        current.set_factory(lambda: fake)
+    else:
+        setattr(module, name, fake)
+
+
+def add_conversation(stand_ins, auth_id, con_id):
+    stand_ins["teams_reverse_mapping"].items[(auth_id,)] = {"auth_id": auth_id, "con_id": con_id}
+    stand_ins["teams_mapping_table"].items[(con_id,)] = {
+        "con_id": con_id, "user_email": f"{auth_id}@example.com", "latest_message": "vpn not working"
+    }
+
+
+def stub_routes():
+    return {
+        "/token": (200, {"access_token": "stub-token", "expires_in": 3599}),
+        "/conversations/": (201, {"id": "activity-id"}),
+        "/haptik/": (200, {"chat_text": "user: vpn not working\nbot: try restarting the client"}),
+    }
+
+
+def synthetic_event(event_type, auth_id, index=0):
+    """
+    Builds a Haptik webhook event of the given type: message, button, carousel, pinned or conversation_complete
+    """
+    bodies = {
+        "message": {"event_name": "message", "message": {"body": {"type": "TEXT", "text": f"Message {index}"}}},
+        "button": {"event_name": "message", "message": {"body": {"type": "BUTTON", "text": "Pick one", "data": {
+            "items": [
+                {"type": "APP_ACTION", "uri": "LINK", "actionable_text": "Guide",
+                 "payload": {"url": "https://files.example.com/guide.pdf"}},
+                {"type": "APP_ACTION", "uri": "LINK", "actionable_text": "Portal",
+                 "payload": {"url": "https://portal.example.com"}},
+                {"type": "TEXT_ONLY", "actionable_text": "Retry", "payload": {"message": "retry"}},
+            ]}}}},
+        "carousel": {"event_name": "message", "message": {"body": {"type": "CAROUSEL", "text": "", "data": {
+            "items": [{"title": f"Step {step}", "thumbnail": {"image": f"https://img.example.com/{step}.png"}}
+                      for step in range(3)]}}}},
+        "pinned": {"event_name": "chat_pinned", "agent": {"name": "jane doe"}},
+        "conversation_complete": {"event_name": "webhook_conversation_complete", "agent": {"is_automated": False},
+                                  "user": {"user_name": auth_id}, "data": {"conversation_no": 1}},
+    }
+    return {"client_id": "bench", "itsm": "bench-itsm", "user": auth_id, "body": bodies[event_type]}
+
+
+EVENT_TYPES = ("message", "button", "carousel", "pinned", "conversation_complete")
+
+
+def sqs_record(event, message_id):
+    """
+    Wraps a lambda_handler event as an SQS record, the shape batch_handler.sqs_handler receives
+    """
+    return {"messageId": message_id, "body": json.dumps(event), "eventSource": "aws:sqs"}
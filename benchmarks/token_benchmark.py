@@ -0,0 +1,54 @@
+"""
+Per-message latency of send_message_to_teams with and without the cached token manager.
+
+Run from the repo root: python -m benchmarks.token_benchmark
+"""
+import os
+import statistics
+import time
+from benchmarks.stubs import start_stub_server, percentile
+
+MESSAGES = 200
+LATENCY = 0.02
+
+server, base_url = start_stub_server({
+    "/token": (200, {"access_token": "stub-token", "expires_in": 3599}),
+    "/conversations/": (201, {"id": "activity-id"}),
+}, latency=LATENCY)
+os.environ["auth_token_url"] = f"{base_url}/token"
+# The sends are measured back to back; Teams' rate limits would otherwise pace both runs alike
+for name in ("teams_conversation_rate", "teams_conversation_burst", "teams_tenant_rate", "teams_tenant_burst"):
+    os.environ.setdefault(name, "100000")
+
+import token_helper  # noqa: E402
+from teams_helper import send_message_to_teams  # noqa: E402
+
+creds = {
+    "teams_base_url": base_url,
+    "teams_client_id": "bench-client",
+    "teams_client_secret": "bench-secret",
+    "teams_scope": "bench-scope",
+}
+
+
+def run(clear_cache):
+    samples = []
+    for _ in range(MESSAGES):
+        if clear_cache:
+            token_helper.clear_token_cache()
+        start = time.perf_counter()
+        send_message_to_teams(creds, "bench-conversation", "hello")
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<22} p50={percentile(samples, 50):7.2f}ms "
+          f"p99={percentile(samples, 99):7.2f}ms mean={statistics.mean(samples):7.2f}ms")
+
+
+if __name__ == "__main__":
+    report("token per message", run(clear_cache=True))
+    server.calls.clear()
+    report("cached token", run(clear_cache=False))
+    print(f"token endpoint calls with cache: {server.calls.get('/token', 0)}")
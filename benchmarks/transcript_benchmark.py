@@ -0,0 +1,61 @@
+"""
+Write latency of one transcript message as the conversation grows: the legacy read-modify-write of
+the concatenated chat_transcript against the append-only transcript_helper.
+
+Run from the repo root: python -m benchmarks.transcript_benchmark
+"""
+import time
+from datetime import datetime
+from benchmarks.stubs import FakeTable, configure_environment, percentile
+
+configure_environment()
+
+import transcript_helper  # noqa: E402
+
+CHECKPOINTS = (10, 100, 250, 500, 1000)
+SAMPLES = 20
+LATENCY_PER_KB = 0.00005
+MESSAGE = "Please restart the VPN client and try connecting again. " * 3
+
+
+def legacy_store(table, message, con_id, agent_name):
+    # The store_message_in_DB implementation this replaces
+    response = table.get_item(Key={"con_id": con_id})
+    chat_transcript = response.get("Item", {}).get("chat_transcript")
+    formatted_time = datetime.now().strftime("%H:%M:%S %d-%m-%Y")
+    message = f"{formatted_time} [{agent_name}]: {message}"
+    if chat_transcript:
+        message = f"{chat_transcript}\n{message}"
+    table.update_item(Key={"con_id": con_id}, UpdateExpression="set chat_transcript=:i",
+                      ExpressionAttributeValues={":i": message})
+
+
+def append_store(table, message, con_id, agent_name):
+    transcript_helper.transcript_table = table
+    transcript_helper.append_message(message, con_id, agent_name)
+
+
+def run(store, key_names):
+    table = FakeTable(key_names, latency_per_kb=LATENCY_PER_KB)
+    results = {}
+    stored = 0
+    for checkpoint in CHECKPOINTS:
+        while stored < checkpoint:
+            store(table, MESSAGE, "bench", "BOT")
+            stored += 1
+        samples = []
+        for _ in range(SAMPLES):
+            start = time.perf_counter()
+            store(table, MESSAGE, "bench", "BOT")
+            samples.append((time.perf_counter() - start) * 1000)
+            stored += 1
+        results[checkpoint] = percentile(samples, 50)
+    return results
+
+
+if __name__ == "__main__":
+    legacy = run(legacy_store, ["con_id"])
+    append = run(append_store, ["con_id", "seq"])
+    print(f"{'messages':>10} {'legacy p50':>12} {'append p50':>12}")
+    for checkpoint in CHECKPOINTS:
+        print(f"{checkpoint:>10} {legacy[checkpoint]:>10.2f}ms {append[checkpoint]:>10.2f}ms")
@@ -0,0 +1,182 @@
+import aws_helper
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class TTLCache:
+    """
+    Bounded LRU of the values a warm container keeps between invocations, safe to share between threads.
+    A value is served for ttl seconds after it was stored, or for as long as it stays in the LRU when ttl is None.
+    """
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0}
+
+    def get(self, key, max_age=None):
+        """
+        Returns the value stored under the key while it is younger than max_age seconds (ttl by default), or None
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if max_age is not None and time.monotonic() - stored_at >= max_age:
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._put(key, value)
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the value stored under the key, storing factory() first when there is none
+        """
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[1] < self.ttl):
+                self._entries.move_to_end(key)
+                return entry[0]
+            value = factory()
+            self._put(key, value)
+            return value
+
+    def pop(self, key, only_if=None):
+        """
+        Drops the key, when given only while only_if is true for the value it holds
+        """
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and (only_if is None or only_if(entry[0])):
+                del self._entries[key]
+
+    def discard(self, predicate):
+        """
+        Drops every key the predicate is true for
+        """
+        with self.lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            for name in self._stats:
+                self._stats[name] = 0
+
+    def count(self, name):
+        with self.lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """
+        Returns the hit/miss counters counted on the cache and its overall hit rate
+        """
+        with self.lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self):
+        with self.lock:
+            return len(self._entries)
+
+    def _put(self, key, value):
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class SharedTier:
+    """
+    Optional DynamoDB cache tier shared by every container, only used when the table's env var is configured.
+    Items carry expires_at for DynamoDB's TTL. Failed reads are logged and served as misses and failed writes
+    are logged, so the tier never fails an event.
+    """
+
+    def __init__(self, table_env, description, key_name="cache_key"):
+        self.table_env = table_env
+        self.description = description
+        self.key_name = key_name
+
+    @property
+    def table(self):
+        if not os.environ.get(self.table_env):
+            return None
+        return aws_helper.table(self.table_env)
+
+    def get(self, key):
+        """
+        Returns the unexpired item stored under the key, or None
+        """
+        table = self.table
+        if table is None:
+            return None
+        try:
+            response = table.get_item(Key={self.key_name: key})
+        except Exception as ex:
+            logger.error(f"Exception raised while reading the shared {self.description}: {ex}")
+            return None
+        item = response.get("Item")
+        if item and float(item.get("expires_at", 0)) > time.time():
+            return item
+        return None
+
+    def batch_get(self, keys, projection=None):
+        """
+        Reads the items of the keys in one call and returns them by key. Expired items are left out
+        unless the projection leaves out expires_at.
+        """
+        table = self.table
+        if table is None:
+            return {}
+        request = {"Keys": [{self.key_name: key} for key in keys]}
+        if projection:
+            request["ProjectionExpression"] = projection
+        try:
+            response = table.meta.client.batch_get_item(RequestItems={table.name: request})
+        except Exception as ex:
+            logger.error(f"Exception raised while reading the shared {self.description}: {ex}")
+            return {}
+        # The Table's client takes and returns plain Python values, like the Table itself
+        now = time.time()
+        return {item[self.key_name]: item for item in response.get("Responses", {}).get(table.name, [])
+                if float(item.get("expires_at", now + 1)) > now}
+
+    def put(self, key, item):
+        table = self.table
+        if table is None:
+            return
+        try:
+            table.put_item(Item=dict(item, **{self.key_name: key}))
+        except Exception as ex:
+            logger.error(f"Exception raised while storing the shared {self.description}: {ex}")
+
+    def delete(self, key, **kwargs):
+        """
+        Deletes the item under the key. A failed ConditionExpression means the item was already replaced.
+        """
+        table = self.table
+        if table is None:
+            return
+        try:
+            table.delete_item(Key={self.key_name: key}, **kwargs)
+        except Exception as ex:
+            if getattr(ex, "response", {}).get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                logger.error(f"Exception raised while dropping the shared {self.description}: {ex}")
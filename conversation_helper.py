@@ -0,0 +1,115 @@
+import aws_helper
+import contextvars
+import logging
+import os
+import threading
+from cache_helper import TTLCache
+from contextlib import contextmanager
+from tracing import span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+reverse_mapping_table = aws_helper.table("teams_reverse_mapping")
+user_mapping_table = aws_helper.table("teams_mapping_table")
+
+# The user_mapping_table attributes the handlers read; the item also carries the legacy transcript.
+# con_id is read as well, so an existing item is never returned empty. user_language is the language code
+# the user reads, where the inbound side has stored it.
+USER_MAPPING_ATTRIBUTES = ("con_id", "user_email", "latest_message", "user_language")
+
+# Seconds a cached auth_id -> con_id mapping may be served before it is read again
+CONVERSATION_CACHE_TTL = int(os.environ.get("conversation_cache_ttl", "300"))
+CONVERSATION_CACHE_SIZE = int(os.environ.get("conversation_cache_size", "4096"))
+
+_conversation_cache = TTLCache(CONVERSATION_CACHE_SIZE, CONVERSATION_CACHE_TTL)
+_current_conversation = contextvars.ContextVar("conversation_context", default=None)
+
+
+class ConversationContext:
+    """
+    The mapping rows of the conversation an event is for. The user_mapping_table attributes are read at most
+    once per invocation.
+    """
+
+    def __init__(self, auth_id, con_id):
+        self.auth_id = auth_id
+        self.con_id = con_id
+        self._user_mapping = None
+        self.lock = threading.Lock()
+
+    def user_mapping(self):
+        # The event's tasks may ask from several threads at once
+        with self.lock:
+            if self._user_mapping is None:
+                self._user_mapping = load_user_mapping(self.con_id)
+            return self._user_mapping
+
+
+def current():
+    """
+    Returns the ConversationContext of the running event, or None
+    """
+    return _current_conversation.get()
+
+
+@contextmanager
+def conversation_context(auth_id, con_id):
+    """
+    Makes the conversation's ConversationContext current for the block
+    """
+    context = ConversationContext(auth_id, con_id)
+    token = _current_conversation.set(context)
+    try:
+        yield context
+    finally:
+        _current_conversation.reset(token)
+
+
+def get_conversation_id(auth_id, max_age=None):
+    """
+    Returns the Teams conversation id mapped to the auth_id, or None. Served from the warm-container cache while
+    it is younger than max_age seconds (conversation_cache_ttl by default); a missing mapping is not cached.
+    """
+    con_id = _conversation_cache.get(auth_id, max_age)
+    if con_id is not None:
+        return con_id
+
+    with span("dynamodb", "get_conversation_id") as sp:
+        response = sp.record_aws_response(reverse_mapping_table.get_item(
+            Key={"auth_id": auth_id}, ProjectionExpression="con_id"))
+    con_id = response.get("Item", {}).get("con_id")
+    if con_id is None:
+        return None
+    _conversation_cache.put(auth_id, con_id)
+    return con_id
+
+
+def invalidate_conversation_id(auth_id=None):
+    """
+    Drops the cached conversation id of the auth_id, or of every auth_id when auth_id is None
+    """
+    if auth_id is None:
+        _conversation_cache.clear()
+    else:
+        _conversation_cache.pop(auth_id)
+
+
+def get_user_mapping(conversation_id):
+    """
+    Returns the USER_MAPPING_ATTRIBUTES of the conversation's user_mapping_table item, or an empty dict.
+    Inside conversation_context they come from the invocation's ConversationContext.
+    """
+    context = _current_conversation.get()
+    if context is not None and context.con_id == conversation_id:
+        return context.user_mapping()
+    return load_user_mapping(conversation_id)
+
+
+def load_user_mapping(conversation_id):
+    # Only the attributes the handlers read, not the whole item with its legacy transcript
+    with span("dynamodb", "get_user_mapping") as sp:
+        response = sp.record_aws_response(user_mapping_table.get_item(
+            Key={"con_id": conversation_id}, ProjectionExpression=", ".join(USER_MAPPING_ATTRIBUTES)))
+    return response.get("Item", {})
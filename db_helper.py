@@ -1,30 +1,87 @@
-import boto3
+import aws_helper
 import logging
 import os
+import time
+from cache_helper import TTLCache
+from dataclasses import dataclass, field
+from tracing import span
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-db_service = boto3.resource("dynamodb")
+client_mapping_table = aws_helper.table("client_mapping_table")
 
-client_mapping_table = db_service.Table(os.environ.get("client_mapping_table"))
+CREDS_ATTRIBUTES = ("teams_base_url", "teams_client_id", "teams_client_secret", "teams_scope",
+                    "bot_business", "bot_client_id", "bot_chat_auth")
 
+# Seconds a cached client config may be served before it is read again
+CLIENT_CONFIG_TTL = int(os.environ.get("client_config_ttl", "300"))
+CLIENT_CONFIG_CACHE_SIZE = int(os.environ.get("client_config_cache_size", "128"))
 
-def get_creds(client_id):
-    # Returns the configured Teams Creds channel
+_client_config_cache = TTLCache(CLIENT_CONFIG_CACHE_SIZE, CLIENT_CONFIG_TTL)
+
+
+@dataclass
+class ClientConfig:
+    client_id: str
+    creds: dict = field(default_factory=dict)
+    is_translation: bool = False
+    # A message containing this marker ends the conversation: "text|conversation_no" triggers ticket resolution
+    termination_marker: str = ""
+    item: dict = field(default_factory=dict)
+    loaded_at: float = 0.0
+
+
+def get_client_config(client_id, max_age=None):
+    """
+    Returns the ClientConfig for the client, served from the warm-container cache while it is
+    younger than max_age seconds (client_config_ttl by default). Reads client_mapping_table once on a miss.
+    """
+    config = _client_config_cache.get(client_id, max_age)
+    if config is not None:
+        return config
+
+    config = load_client_config(client_id)
+    if config is None:
+        return None
+    _client_config_cache.put(client_id, config)
+    return config
+
+
+def load_client_config(client_id):
+    """
+    Reads the client_mapping_table row for the client and builds its ClientConfig
+    """
     logger.info(f"checking the client info for client: {client_id}")
-    response = client_mapping_table.get_item(Key={"client_id": client_id})
-    logger.debug(f"Response of client_id mapping: {response}")
-    creds = {}
-    if "Item" in response:
-        creds["teams_base_url"] = response.get("Item", {}).get("teams_base_url")
-        creds["teams_client_id"] = response.get("Item", {}).get("teams_client_id")
-        creds["teams_client_secret"] = response.get("Item", {}).get("teams_client_secret")
-        creds["teams_scope"] = response.get("Item", {}).get("teams_scope")
-        creds["bot_business"] = response.get("Item", {}).get("bot_business")
-        creds["bot_client_id"] = response.get("Item", {}).get("bot_client_id")
-        creds["bot_chat_auth"] = response.get("Item", {}).get("bot_chat_auth")
-        return creds
-    else:
+    with span("dynamodb", "get_client_config") as sp:
+        response = sp.record_aws_response(client_mapping_table.get_item(Key={"client_id": client_id}))
+    if "Item" not in response:
         logger.error(f"Creds not found for client_id: {client_id}")
+        return None
+    item = response["Item"]
+    return ClientConfig(
+        client_id=client_id,
+        creds={name: item.get(name) for name in CREDS_ATTRIBUTES},
+        is_translation=bool(item.get("is_translation", "")),
+        termination_marker=item.get("ticket_termination_marker", ""),
+        item=item,
+        loaded_at=time.time()
+    )
+
+
+def invalidate_client_config(client_id=None):
+    """
+    Drops the cached config of the client, or of every client when client_id is None
+    """
+    if client_id is None:
+        _client_config_cache.clear()
+    else:
+        _client_config_cache.pop(client_id)
+
+
+def get_creds(client_id):
+    # Returns the configured Teams Creds channel
+    config = get_client_config(client_id)
+    if config:
+        return config.creds
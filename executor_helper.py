@@ -0,0 +1,94 @@
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_IO_WORKERS = int(os.environ.get("max_io_workers", "8"))
+# Conversations of an SQS batch processed at the same time
+MAX_BATCH_WORKERS = int(os.environ.get("max_batch_workers", "8"))
+
+# The pools live at module level so warm invocations reuse their threads
+_executor = None
+_batch_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_IO_WORKERS, thread_name_prefix="io")
+    return _executor
+
+
+def get_batch_executor():
+    """
+    Returns the pool batch work (one task per conversation) runs on. It is separate from the I/O pool because
+    a conversation's events wait on I/O pool tasks, which would deadlock once every I/O thread waits itself.
+    """
+    global _batch_executor
+    if _batch_executor is None:
+        with _executor_lock:
+            if _batch_executor is None:
+                _batch_executor = ThreadPoolExecutor(max_workers=MAX_BATCH_WORKERS, thread_name_prefix="batch")
+    return _batch_executor
+
+
+def submit_batch(func, *args, **kwargs):
+    """
+    Runs the call on the batch pool with the caller's context variables
+    """
+    context = contextvars.copy_context()
+    return get_batch_executor().submit(context.run, func, *args, **kwargs)
+
+
+def submit(func, *args, **kwargs):
+    """
+    Runs the call on the shared I/O pool. The caller's context variables (write buffer, invoke batcher)
+    are carried over so the call behaves as if it ran inline.
+    """
+    context = contextvars.copy_context()
+    return get_executor().submit(context.run, func, *args, **kwargs)
+
+
+def map_concurrently(func, items):
+    """
+    Calls func for every item on the shared I/O pool and returns the results in the order of items
+    """
+    futures = [submit(func, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def run_task_graph(tasks):
+    """
+    Runs a small dependency graph of tasks on the shared I/O pool.
+    tasks maps a name to (func, dependencies); func is called with the results of its dependencies, in order,
+    as soon as all of them are done, so independent tasks overlap. Returns the result of every task by name.
+    When a task raises, no further task is started and the error is re-raised once the running ones are done.
+    """
+    results = {}
+    running = {}
+    pending = dict(tasks)
+    while pending or running:
+        for name, (func, dependencies) in list(pending.items()):
+            if all(dependency in results for dependency in dependencies):
+                running[submit(func, *[results[dependency] for dependency in dependencies])] = name
+                del pending[name]
+        if not running:
+            raise ValueError(f"Unresolvable task dependencies: {sorted(pending)}")
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = running.pop(future)
+            try:
+                results[name] = future.result()
+            except Exception:
+                # The tasks still running may be writing through the caller's buffers and lease; let them
+                # finish before those are flushed and released
+                wait(running)
+                raise
+    return results
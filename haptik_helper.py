@@ -1,13 +1,107 @@
+import codecs
 import json
-import requests
+import os
+import re
+import async_helper
+import http_helper
 import logging
+from offload_helper import TranscriptSpool
+from tracing import span
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+CHAT_HISTORY_URL = os.environ.get(
+    "haptik_chat_history_url", "https://staging.hellohaptik.com/integration/external/v1.0/get_chat_history/")
+CHAT_HISTORY_CHUNK_SIZE = int(os.environ.get("chat_history_chunk_size", "65536"))
+
+_CHAT_TEXT_KEY = re.compile(r'"chat_text"\s*:\s*(null|")')
+# Characters and complete escapes of a JSON string; stops at its closing quote or at an escape cut by the chunk
+_STRING_BODY = re.compile(r'(?:[^"\\]+|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*')
+# A high surrogate escape whose low half may still be in the next chunk
+_HIGH_SURROGATE = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}$')
+_json_decoder = json.JSONDecoder(strict=False)
+
+
+class ChatTextExtractor:
+    """
+    Pulls the "chat_text" string out of the chat history JSON as it streams in and hands it to write piece by
+    piece, so the body is never held whole
+    """
+
+    def __init__(self, write):
+        self.write = write
+        self.pending = ""
+        self.in_text = False
+        self.found = False
+        self.done = False
+
+    def feed(self, text):
+        """
+        Takes the next decoded piece of the body. Returns False once the rest of the body is not needed.
+        """
+        self.pending += text
+        if not self.in_text:
+            match = _CHAT_TEXT_KEY.search(self.pending)
+            if match is None:
+                # Keep enough of the tail to match a key cut by the chunk boundary
+                self.pending = self.pending[-256:]
+                return True
+            if match.group(1) == "null":
+                self.done = True
+                return False
+            self.in_text = self.found = True
+            self.pending = self.pending[match.end():]
+        end = _STRING_BODY.match(self.pending).end()
+        closed = end < len(self.pending) and self.pending[end] == '"'
+        if not closed:
+            surrogate = _HIGH_SURROGATE.search(self.pending, 0, end)
+            if surrogate is not None:
+                end = surrogate.start()
+            if len(self.pending) - end > 12:
+                raise ValueError(f"Invalid escape in chat_text: {self.pending[end:end + 12]!r}")
+        piece, self.pending = self.pending[:end], self.pending[end:]
+        accepted = not piece or self.write(_json_decoder.decode(f'"{piece}"'))
+        if closed:
+            self.done = True
+        return accepted and not closed
+
+
 def get_chat_transcripts(creds, user_name, conversation_number):
-    # Returns the chat transcript Text
-    url = "https://staging.hellohaptik.com/integration/external/v1.0/get_chat_history/"
+    """
+    Returns the chat transcript as an offload_helper.ChatTranscript, or None when Haptik did not return one.
+    The response is streamed and decoded as it arrives; a transcript too large for the ticket payload is
+    compressed and offloaded to S3 on the way, so memory does not grow with the length of the chat.
+    """
+    parameters, headers = chat_history_request(creds, user_name, conversation_number)
+    spool = TranscriptSpool()
+    extractor = ChatTextExtractor(spool.write)
+    with span("haptik", "chat_history") as sp:
+        with http_helper.request("GET", CHAT_HISTORY_URL, params=parameters, headers=headers,
+                                 stream=True) as response:
+            sp.record_response(response)
+            if response.status_code != 200:
+                logging.error(f"Chat history API return unhandled status_code:\n{response.status_code}")
+                return None
+            decoder = codecs.getincrementaldecoder("utf-8")("replace")
+            for chunk in response.iter_content(CHAT_HISTORY_CHUNK_SIZE):
+                if not extractor.feed(decoder.decode(chunk)):
+                    break
+            else:
+                extractor.feed(decoder.decode(b"", final=True))
+                if extractor.found and not extractor.done:
+                    logging.error("Chat history API response ended inside chat_text")
+    if not extractor.found:
+        return None
+    return spool.finish()
+
+
+async def get_chat_transcripts_async(creds, user_name, conversation_number):
+    # Streams the transcript on the I/O pool: decoding it and offloading it to S3 are blocking work
+    return await async_helper.run_blocking(get_chat_transcripts, creds, user_name, conversation_number)
+
+
+def chat_history_request(creds, user_name, conversation_number):
     parameters = {
         "user_name": user_name,
         "business_id": int(creds["bot_business"]),
@@ -19,8 +113,4 @@ def get_chat_transcripts(creds, user_name, conversation_number):
         "client-id": creds["bot_client_id"],
         "Authorization": creds["bot_chat_auth"]
     }
-    response = requests.request("GET", url, params=parameters, headers=headers)
-    logging.debug(f"Response of the Chat history API:\n{response.text}")
-    if response.status_code == 200:
-        return response.json().get("chat_text")
-    logging.error(f"Chat history API return unhandled status_code:\n{response.status_code}")
+    return parameters, headers
@@ -0,0 +1,80 @@
+import logging
+import os
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+CONNECT_TIMEOUT = float(os.environ.get("http_connect_timeout", "3.05"))
+READ_TIMEOUT = float(os.environ.get("http_read_timeout", "10"))
+POOL_SIZE = int(os.environ.get("http_pool_size", "10"))
+MAX_RETRIES = int(os.environ.get("http_max_retries", "3"))
+BACKOFF_FACTOR = float(os.environ.get("http_backoff_factor", "0.2"))
+
+# Sessions live at module level so warm invocations reuse the open connections
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def request(method, url, retry=True, **kwargs):
+    """
+    Sends the request through the pooled keep-alive session of the url's host.
+    Applies the default connect/read timeouts unless the caller passes its own.
+    With retry=False the session does not retry at all, for callers that run their own retries.
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session(url, retry).request(method, url, **kwargs)
+
+
+def retry_count(response):
+    """
+    Returns how many times urllib3 retried the request before it got this response
+    """
+    retries = getattr(getattr(response, "raw", None), "retries", None)
+    return len(retries.history) if retries is not None else 0
+
+
+def get_session(url, retry=True):
+    """
+    Returns the pooled session for the scheme and host of the url, creating it on first use
+    """
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get((host, retry))
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get((host, retry))
+            if session is None:
+                session = _build_session(retry)
+                _sessions[(host, retry)] = session
+                logger.info(f"Created pooled HTTP session for {host}")
+    return session
+
+
+def _build_session(retry=True):
+    if not retry:
+        return _mount(requests.Session(), Retry(total=0, read=False, raise_on_status=False))
+    # Only idempotent methods get their read and status errors retried, with bounded exponential backoff.
+    # urllib3 retries connect errors of every method, as the request never reached the server.
+    retry = Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        raise_on_status=False
+    )
+    return _mount(requests.Session(), retry)
+
+
+def _mount(session, retry):
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
@@ -0,0 +1,75 @@
+import aws_helper
+import contextvars
+import json
+import logging
+import threading
+from contextlib import contextmanager
+import executor_helper
+from tracing import span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+lambda_client = aws_helper.client("lambda")
+
+_current_batcher = contextvars.ContextVar("invoke_batcher", default=None)
+
+
+class InvokeBatcher:
+    """
+    Starts asynchronous ("Event") Lambda invokes in the background as they are added and waits for them on flush
+    """
+
+    def __init__(self):
+        self.futures = []
+        self.lock = threading.Lock()
+
+    def add(self, function_name, payload):
+        future = executor_helper.submit(invoke_event, function_name, payload)
+        with self.lock:
+            self.futures.append(future)
+
+    def flush(self):
+        with self.lock:
+            futures, self.futures = self.futures, []
+        failed = 0
+        for future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                failed += 1
+                logger.error(f"Exception raised while invoking the Lambda: {ex}")
+        if futures:
+            logger.info(f"Completed {len(futures)} Lambda invokes, {failed} failed")
+
+
+@contextmanager
+def batched_invokes():
+    """
+    Lets the invokes made inside the block run concurrently and waits for all of them when it exits
+    """
+    batcher = InvokeBatcher()
+    token = _current_batcher.set(batcher)
+    try:
+        yield batcher
+    finally:
+        _current_batcher.reset(token)
+        batcher.flush()
+
+
+def invoke_async(function_name, payload):
+    """
+    Invokes the Lambda with InvocationType Event, in the background when inside batched_invokes
+    """
+    batcher = _current_batcher.get()
+    if batcher is None:
+        invoke_event(function_name, payload)
+    else:
+        batcher.add(function_name, payload)
+
+
+def invoke_event(function_name, payload):
+    with span("lambda", function_name) as sp:
+        return sp.record_aws_response(lambda_client.invoke(FunctionName=function_name,
+                                                           InvocationType="Event",
+                                                           Payload=json.dumps(payload)))
@@ -1,32 +1,194 @@
-import boto3
+import aws_helper
+import hashlib
 import os
 import logging
+import re
+import time
+from cache_helper import SharedTier, TTLCache
+from log_helper import verbose
+from tracing import span
 
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+logger.setLevel(logging.INFO)
+
+kendra = aws_helper.client('kendra')
+
+KENDRA_CACHE_SIZE = int(os.environ.get("kendra_cache_size", "512"))
+# Seconds a result is served from the cache before Kendra is queried again
+KENDRA_CACHE_TTL = int(os.environ.get("kendra_cache_ttl", "86400"))
+# Seconds an index's invalidation marker is cached, which bounds how long a container keeps serving results of
+# an index that another container invalidated
+KENDRA_MARKER_TTL = int(os.environ.get("kendra_marker_ttl", "30"))
+
+# Results are cached with the time they were queried at, to be checked against the index's invalidation marker
+_result_cache = TTLCache(KENDRA_CACHE_SIZE, KENDRA_CACHE_TTL)
+_index_markers = TTLCache(64, KENDRA_MARKER_TTL)
+_shared_results = SharedTier("kendra_cache_table", "Kendra result")
+
+
+# Number of answers/document links kept per query and the lowest ScoreConfidence that is still shown
+KENDRA_TOP_K = int(os.environ.get("kendra_top_k", "3"))
+KENDRA_MIN_CONFIDENCE = os.environ.get("kendra_min_confidence", "NOT_AVAILABLE")
+# When set, Kendra is asked for this many results only, which is faster and cheaper to parse
+KENDRA_PAGE_SIZE = os.environ.get("kendra_page_size")
+
+CONFIDENCE_RANK = {"VERY_HIGH": 4, "HIGH": 3, "MEDIUM": 2, "LOW": 1, "NOT_AVAILABLE": 0}
+NO_RESULTS_MESSAGE = "Couldn't find the results for the given query, kindly try changing your phrase a bit"
 
-kendra = boto3.client('kendra')
 
 def search_kendra(query):
+    """
+    Returns the message to show for the query and up to kendra_top_k document links, best first
+    """
     index_id = os.environ.get('index_id')
-    response=kendra.query(QueryText = query, IndexId = index_id)
-    logger.debug(f"Kendra Response for the query: {query} is:\n{response}")
-    answer = ""
-    link = ""
-    for query_result in response['ResultItems']:
-        if query_result['Type']=='ANSWER':
-            answer = query_result['DocumentExcerpt']['Text']
-
-        if query_result['Type']=='DOCUMENT':
-            document_text = query_result['DocumentExcerpt']['Text']
-            link = query_result["DocumentURI"]
-            break
-    if answer == '':
-        if link == '':
-            message = "Couldn't find the results for the given query, kindly try changing your phrase a bit"
-        else:
-            message = " ".join(document_text.split())
+    key = (index_id, normalize_query(query))
+    result = _lookup_result(key)
+    if result is not None:
+        return result
+    queried_at = _now_ms()
+    result = query_kendra(query, index_id)
+    _result_cache.put(key, (result, queried_at))
+    put_shared_result(key, result, queried_at)
+    return result
+
+
+def query_kendra(query, index_id):
+    query_arguments = {"QueryText": query, "IndexId": index_id}
+    if KENDRA_PAGE_SIZE:
+        query_arguments["PageSize"] = int(KENDRA_PAGE_SIZE)
+    with span("kendra", "query") as sp:
+        response = sp.record_aws_response(kendra.query(**query_arguments))
+    verbose("Kendra Response for the query: %s is: %s", query, response)
+    answers, documents = rank_results(response)
+    if answers:
+        message = answers[0]
+    elif documents:
+        message = documents[0][1]
     else:
-        message  = " ".join(answer.split())
-    
-    return message, link
\ No newline at end of file
+        message = NO_RESULTS_MESSAGE
+    return message, [uri for uri, _ in documents]
+
+
+def rank_results(response, top_k=None, min_confidence=None):
+    """
+    Goes through the ResultItems once and returns the top_k answer texts and the top_k (DocumentURI, excerpt)
+    documents, ranked by ScoreConfidence. Results below min_confidence are dropped and documents are deduped by URI.
+    Results of equal confidence keep Kendra's order.
+    """
+    top_k = KENDRA_TOP_K if top_k is None else top_k
+    cutoff = CONFIDENCE_RANK.get(min_confidence or KENDRA_MIN_CONFIDENCE, 0)
+    answers = []
+    documents = []
+    seen_uris = set()
+    for position, query_result in enumerate(response.get('ResultItems', [])):
+        confidence = CONFIDENCE_RANK.get(query_result.get("ScoreAttributes", {}).get("ScoreConfidence"), 0)
+        if confidence < cutoff:
+            continue
+        text = " ".join(query_result.get('DocumentExcerpt', {}).get('Text', "").split())
+        if query_result['Type'] == 'ANSWER' and text:
+            answers.append((-confidence, position, text))
+        elif query_result['Type'] == 'DOCUMENT':
+            uri = query_result.get("DocumentURI")
+            if uri and uri not in seen_uris:
+                seen_uris.add(uri)
+                documents.append((-confidence, position, uri, text))
+    answers.sort()
+    documents.sort()
+    return [text for _, _, text in answers[:top_k]], [(uri, text) for _, _, uri, text in documents[:top_k]]
+
+
+def normalize_query(query):
+    # "Reset password?" and "reset  password" share a cache entry
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+def invalidate_index(index_id):
+    """
+    Drops the cached results of the index, e.g. after it was re-synced.
+    The shared tier keeps a per-index marker, which every container checks its cached results against within
+    kendra_marker_ttl seconds.
+    """
+    invalidated_at = _now_ms()
+    _result_cache.discard(lambda key: key[0] == index_id)
+    _index_markers.put(index_id, invalidated_at)
+    table = _shared_results.table
+    if table is None:
+        return
+    # The marker outlives every result it invalidates
+    table.put_item(Item={"cache_key": _index_marker_key(index_id), "invalidated_at": invalidated_at,
+                         "expires_at": invalidated_at // 1000 + KENDRA_CACHE_TTL})
+
+
+def index_invalidated_at(index_id):
+    """
+    Returns when the index was last invalidated, in epoch milliseconds, reading the shared tier's marker at most
+    once every kendra_marker_ttl seconds
+    """
+    invalidated_at = _index_markers.get(index_id)
+    if invalidated_at is None:
+        item = _shared_results.get(_index_marker_key(index_id)) or {}
+        invalidated_at = int(item.get("invalidated_at", 0))
+        _index_markers.put(index_id, invalidated_at)
+    return invalidated_at
+
+
+def get_cache_stats():
+    """
+    Returns the hit/miss counters of the Kendra result cache and its overall hit rate
+    """
+    return _result_cache.stats()
+
+
+def get_shared_result(key):
+    """
+    Reads the result and the time it was queried at from the shared DynamoDB tier, together with the index
+    marker in the same call
+    """
+    if _shared_results.table is None:
+        return None
+    items = _shared_results.batch_get([_shared_key(key), _index_marker_key(key[0])])
+    invalidated_at = int(items.get(_index_marker_key(key[0]), {}).get("invalidated_at", 0))
+    _index_markers.put(key[0], invalidated_at)
+    entry = items.get(_shared_key(key))
+    if not entry or int(entry["cached_at"]) <= invalidated_at:
+        return None
+    return (entry["message"], list(entry.get("links", []))), int(entry["cached_at"])
+
+
+def put_shared_result(key, result, cached_at):
+    message, links = result
+    _shared_results.put(_shared_key(key), {
+        "message": message,
+        "links": links,
+        "cached_at": cached_at,
+        "expires_at": cached_at // 1000 + KENDRA_CACHE_TTL
+    })
+
+
+def _lookup_result(key):
+    cached = _result_cache.get(key)
+    if cached is not None:
+        result, cached_at = cached
+        if cached_at > index_invalidated_at(key[0]):
+            _result_cache.count("hits")
+            return result
+        _result_cache.pop(key)
+    cached = get_shared_result(key)
+    _result_cache.count("shared_hits" if cached else "misses")
+    if cached:
+        _result_cache.put(key, cached)
+        return cached[0]
+    return None
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def _shared_key(key):
+    index_id, query = key
+    return f"{index_id}|{hashlib.sha256(query.encode()).hexdigest()}"
+
+
+def _index_marker_key(index_id):
+    return f"{index_id}|#invalidated"
@@ -1,88 +1,88 @@
 import json
 import logging
 import os
-import boto3
-import requests
-from datetime import datetime
-from translation_helper import handle_message_translation
+import async_helper
+import aws_helper
+import async_pipeline
+import http_helper
+from activity_builder import TEAMS_MAX_CARD_BUTTONS, trim_buttons
+from translation_helper import translation_context
 from teams_helper import send_message_to_teams, send_image_teams, send_button_message_to_teams
-from db_helper import get_creds
+from db_helper import get_client_config
+from conversation_helper import conversation_context, get_conversation_id, get_user_mapping
 from haptik_helper import get_chat_transcripts
 from kendra_helper import search_kendra
+from write_buffer import buffered_writes, append_transcript, update_attributes
+from invoke_helper import batched_invokes, invoke_async
+from executor_helper import run_task_graph
+from log_helper import verbose
 from profiler import profile
+from sequence_helper import conversation_lease
+from tracing import current_trace_id, trace
 
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-lambda_client = boto3.client("lambda")
-db_service = boto3.resource("dynamodb")
-user_mapping_table = db_service.Table(os.environ.get('teams_mapping_table'))
-reverse_mapping_table = db_service.Table(
-    os.environ.get('teams_reverse_mapping'))
-client_mapping_table = db_service.Table(os.environ.get('client_mapping_table'))
+user_mapping_table = aws_helper.table('teams_mapping_table')
+
+# "async" runs events through async_pipeline; an event can override it with its own pipeline_mode
+PIPELINE_MODE = os.environ.get("pipeline_mode", "sync")
 
 
 @profile
 def lambda_handler(event, context):
     # Analyzes the event and sends the message to user in Teams
+    # Every outbound call of the event is traced under the event's trace id and client_id
+    trace_id = event.get("trace_id") or getattr(context, "aws_request_id", None)
+    with trace(event.get("client_id"), trace_id):
+        return process_event(event, context)
+
+
+def process_event(event, context=None, conversation_id=None, client_config=None):
+    """
+    Handles one event. Callers that already looked up the event's conversation_id or client config,
+    like the SQS batch handler, pass them in so they are not read again.
+    """
+    payload = event.get("body")
+    event_name = payload.get('event_name', "")
+    # Unsupported events are dropped before any lookup is made for them
+    if event_name not in EVENT_HANDLERS:
+        logger.info(f"Received Unsupported event: {event_name}")
+        return
+    if event.get("pipeline_mode", PIPELINE_MODE) == "async":
+        return async_helper.run(async_pipeline.lambda_handler_async(event, context, conversation_id, client_config))
     client_id = event.get("client_id")
     itsm = event.get("itsm")
     auth_id = event.get("user")
-    payload = event.get("body")
-    logger.info(payload)
-    auth_mapping_response = reverse_mapping_table.get_item(
-        Key={"auth_id": auth_id})
-    if "Item" in auth_mapping_response:
-        conversation_id = auth_mapping_response.get("Item", {}).get("con_id")
-    else:
+    verbose("Event payload: %s", payload)
+    if conversation_id is None:
+        conversation_id = get_conversation_id(auth_id)
+    if conversation_id is None:
         logger.error(
             f"Couldn't find the conversation_id for the given auth_id: {auth_id}")
         return
 
-    creds = get_creds(client_id)
+    if client_config is None:
+        client_config = get_client_config(client_id)
+    if client_config is None:
+        logger.error(f"Items not found for the client: {client_id}")
+        return
+    creds = client_config.creds
+    translation = translation_context(client_config, auth_id, conversation_id)
 
-    event_name = payload.get('event_name', "")
     is_automated = payload.get("agent", {}).get("is_automated")
 
-    user_response = client_mapping_table.get_item(Key={"client_id": client_id})
-    if "Item" in user_response:
-        is_translation = user_response.get(
-            "Item", {}).get("is_translation", "")
-    else:
-        logger.info(f"Items not found for the client:   {client_id}")
-
-    if 'webhook_conversation_complete' in event_name:
-        logger.info("Received Conversation completed event")
-        handle_resolution_event(is_translation, creds, payload,
-                                auth_id, is_automated, itsm, client_id, conversation_id)
-    elif "message" in event_name:
-        logger.info("Received Message event")
-        message = payload.get("message", {}).get("body", {}).get("text", "")
-        logger.info(message)
-        logger.info("Alright! I'll be around if you need more help" in message)
-        logger.info(client_id)
-        logger.info(client_id == "4")
-        if (("Alright! I'll be around if you need more help" in message) and (client_id == "4")):
-            logger.info(
-                "Handling Ticket termination based on message received")
-            payload["message"]["body"]["text"] = message.split("|")[0]
-            payload["data"] = {"conversation_no": message.split("|")[1]}
-            handle_message_event(is_translation, creds, payload,
-                                 auth_id, conversation_id, itsm, client_id)
-            handle_resolution_event(is_translation, creds, payload,
-                                    auth_id, is_automated, itsm, client_id, conversation_id)
-        else:
-            handle_message_event(is_translation, creds, payload,
-                                 auth_id, conversation_id, itsm, client_id)
-
-    elif "chat_pinned" in event_name:
-        logger.info("Received Chat Pinned event")
-        handle_pinned_event(is_translation, creds, payload,
-                            auth_id, conversation_id)
-    else:
-        logger.info(f"Received Unsupported event: {event_name}")
+    # The lease is released after the buffered writes and invokes are flushed, so the next event of the
+    # conversation sees everything this one stored
+    with conversation_lease(conversation_id, current_trace_id()) as lease:
+        if lease is not None and lease.duplicate:
+            logger.info(f"Skipping event already processed for conversation: {conversation_id}")
+            return
+        with conversation_context(auth_id, conversation_id), buffered_writes(), batched_invokes():
+            handle_event(event_name, translation, creds, payload,
+                         auth_id, is_automated, itsm, client_id, conversation_id, client_config)
 
     return {
         'statusCode': 200,
@@ -90,7 +90,62 @@ def lambda_handler(event, context):
     }
 
 
-def handle_pinned_event(is_translation, creds, payload, auth_id, conversation_id):
+def handle_event(event_name, translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id,
+                 client_config=None):
+    """
+    Routes the event to the handler registered for its exact event_name in EVENT_HANDLERS
+    """
+    handler = EVENT_HANDLERS.get(event_name)
+    if handler is None:
+        logger.info(f"Received Unsupported event: {event_name}")
+        return
+    handler(translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id, client_config)
+
+
+def route_resolution_event(translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id,
+                           client_config):
+    logger.info("Received Conversation completed event")
+    handle_resolution_event(translation, creds, payload,
+                            auth_id, is_automated, itsm, client_id, conversation_id)
+
+
+def route_message_event(translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id,
+                        client_config):
+    logger.info("Received Message event")
+    if apply_termination_rule(payload, client_config):
+        logger.info(
+            "Handling Ticket termination based on message received")
+        handle_message_event(translation, creds, payload,
+                             auth_id, conversation_id, itsm, client_id)
+        handle_resolution_event(translation, creds, payload,
+                                auth_id, is_automated, itsm, client_id, conversation_id)
+    else:
+        handle_message_event(translation, creds, payload,
+                             auth_id, conversation_id, itsm, client_id)
+
+
+def route_pinned_event(translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id,
+                       client_config):
+    logger.info("Received Chat Pinned event")
+    handle_pinned_event(translation, creds, payload,
+                        auth_id, conversation_id)
+
+
+def apply_termination_rule(payload, client_config):
+    """
+    Checks the message against the client's ticket_termination_marker. A matching "text|conversation_no" message
+    is rewritten to its text and its conversation number is set as the event data. Returns True on a match.
+    """
+    marker = client_config.termination_marker if client_config else ""
+    message = payload.get("message", {}).get("body", {}).get("text", "")
+    if not marker or marker not in message or "|" not in message:
+        return False
+    payload["message"]["body"]["text"] = message.split("|")[0]
+    payload["data"] = {"conversation_no": message.split("|")[1]}
+    return True
+
+
+def handle_pinned_event(translation, creds, payload, auth_id, conversation_id):
     """
     Posts a message in the chat window that a user has entered the conversation
     """
@@ -100,31 +155,23 @@ def handle_pinned_event(is_translation, creds, payload, auth_id, conversation_id
         agent_name = "IT Agent"
     message = f"----- *{agent_name} has entered the conversation* -----"
 
-    if is_translation:
-        logger.info("is_translation is True. Translation function is called")
-        message = handle_message_translation(message, auth_id)
-    message = handle_message_translation(message, auth_id)
+    message = translation.translate(message)
     # response = user_mapping_table.get_item(Key={"con_id": conversation_id})
-    user_mapping_table.update_item(
-        Key={"con_id": conversation_id},
-        UpdateExpression="set agent_name=:a",
-        ExpressionAttributeValues={
-            ":a": agent_name
-        })
-    send_message_to_teams(creds, conversation_id, message)
-    store_message_in_DB(message, conversation_id, agent_name)
+    update_attributes(user_mapping_table, {"con_id": conversation_id}, {"agent_name": agent_name})
+    if send_message_to_teams(creds, conversation_id, message) is not None:
+        store_message_in_DB(message, conversation_id, agent_name)
 
 
-def handle_message_event(is_translation, creds, payload, auth_id, conversation_id, itsm, client_id):
+def handle_message_event(translation, creds, payload, auth_id, conversation_id, itsm, client_id):
     """
     Handles incoming message event
     """
     logger.info("Handling Message event")
     message = payload.get("message", {}).get("body", {}).get("text", "")
     message_type = payload.get("message", {}).get("body", {}).get("type", "")
-    response = user_mapping_table.get_item(Key={"con_id": conversation_id})
-    email = response.get("Item", {}).get("user_email")
-    query = response.get("Item", {}).get("latest_message")
+    user_mapping = get_user_mapping(conversation_id)
+    email = user_mapping.get("user_email")
+    query = user_mapping.get("latest_message")
     try:
         agent_name = payload.get("agent", {}).get("name").title()
     except AttributeError:
@@ -132,21 +179,8 @@ def handle_message_event(is_translation, creds, payload, auth_id, conversation_i
 
     item_list = []
     if 'BOT BREAK' in message or payload.get("message", {}).get("body", {}).get("data", {}).get("intents"):
-        item_json = {
-                "type": "imBack",
-                "title": "Talk to an Agent 💬",
-                "value": "Talk to an Agent"
-            }
-        item_list.append(item_json)
-        disambiguation_list = payload.get("message", {}).get("body", {}).get("data", {}).get("intents", [])
-        for Item in disambiguation_list:
-            item_json = {
-                    "type": "imBack",
-                    "title": f"{Item} 💬",
-                    "value": Item
-                }
-            item_list.append(item_json)
-        return handle_kendra_search(item_list, query, creds, conversation_id, agent_name)
+        item_list = build_disambiguation_items(payload)
+        return handle_kendra_search(item_list, query, creds, conversation_id, agent_name, translation)
 
     # if payload.get("message", {}).get("body", {}).get("data", {}).get("intents"):
     #     item_json = {
@@ -165,107 +199,210 @@ def handle_message_event(is_translation, creds, payload, auth_id, conversation_i
     #         item_list.append(item_json)
     
 
-    if 'BUTTON' in message_type:
-        message_url_items = payload.get("message", {}).get(
-            "body", {}).get("data", {}).get("items", [{}])
-        for Item in message_url_items:
-            thumb_url = Item.get("payload", {}).get("url", "")
-            actionable_text = Item.get("actionable_text", "")
-            uri = Item.get("uri", "")
-            item_type = Item.get("type", "")
-            item_message = Item.get("payload", {}).get("message", "")
-            if item_type.lower() == "app_action" and uri.lower() == "link":
-                if ".pdf" in thumb_url or ".docx" in thumb_url:
-                    item_json = {
-                        "type": "openUrl",
-                        "title": f"{actionable_text} 📎",
-                        "value": thumb_url
-                    }
-                    item_list.append(item_json)
-                    store_message_in_DB(
-                        "ATTACHMENT", conversation_id, agent_name)
-                    if ".pdf" in thumb_url:
-                        file_type = "pdf"
-                    else:
-                        file_type = "docx"
-                    ticket_attachment_invoke(
-                        file_type, itsm, auth_id, conversation_id, client_id, email, actionable_text, thumb_url)
+    message_type_handler = MESSAGE_TYPE_HANDLERS.get(message_type)
+    if message_type_handler:
+        prepared = message_type_handler(payload, message, creds, conversation_id, agent_name,
+                                        itsm, auth_id, client_id, email)
+        if prepared is None:
+            return
+        item_list, message = prepared
+    if item_list:
+        # Trimmed before translating so the buttons Teams cannot show are not translated either
+        item_list = trim_buttons(item_list)
+        message = translation.translate_card(message, item_list)
+    else:
+        message = translation.translate(message)
+    if item_list:
+        sent = send_button_message_to_teams(
+            item_list, creds, conversation_id, message)
+    else:
+        sent = send_message_to_teams(creds, conversation_id, message)
+    # Only activities Teams accepted go into the transcript; dropped ones are with the dead-letter hook
+    if sent is not None:
+        store_message_in_DB(message, conversation_id, agent_name)
+
+
+def handle_button_message(payload, message, creds, conversation_id, agent_name, itsm, auth_id, client_id, email):
+    """
+    Builds the buttons of a BUTTON message and forwards its file links as ticket attachments.
+    Returns the buttons and the message text to send with them.
+    """
+    item_list, attachments = build_button_items(payload)
+    for file_type, actionable_text, thumb_url in attachments:
+        store_message_in_DB(
+            "ATTACHMENT", conversation_id, agent_name)
+        ticket_attachment_invoke(
+            file_type, itsm, auth_id, conversation_id, client_id, email, actionable_text, thumb_url)
+    if not message:
+        message = "You can click the below button to download the file."
+    return item_list, message
+
+
+def handle_carousel_message(payload, message, creds, conversation_id, agent_name, itsm, auth_id, client_id, email):
+    """
+    Sends the images of a CAROUSEL message. Returns None as nothing is left to send.
+    """
+    logger.info("Invoking Attachment consent to forward the Attachment")
+    images = collect_carousel_images(payload)
+    # The ticket invokes run in the background while the images are posted to Teams in their original order
+    for img_url, title in images:
+        ticket_attachment_invoke(
+            "png", itsm, auth_id, conversation_id, client_id, email, title, img_url)
+    for img_url, title in images:
+        if send_image_teams(creds, conversation_id, img_url, title) is not None:
+            store_message_in_DB("IMAGE", conversation_id, agent_name)
+
+
+def build_disambiguation_items(payload):
+    """
+    Builds the "Talk to an Agent" button followed by one button per disambiguation intent
+    """
+    item_list = [{
+        "type": "imBack",
+        "title": "Talk to an Agent 💬",
+        "value": "Talk to an Agent"
+    }]
+    disambiguation_list = payload.get("message", {}).get("body", {}).get("data", {}).get("intents", [])
+    for Item in disambiguation_list:
+        item_json = {
+                "type": "imBack",
+                "title": f"{Item} 💬",
+                "value": Item
+            }
+        item_list.append(item_json)
+    return item_list
+
+
+def build_button_items(payload):
+    """
+    Builds the Teams buttons of a BUTTON message.
+    Also returns the (file_type, title, url) of every PDF/DOCX link, which are forwarded as ticket attachments.
+    """
+    item_list = []
+    attachments = []
+    message_url_items = payload.get("message", {}).get(
+        "body", {}).get("data", {}).get("items", [{}])
+    for Item in message_url_items:
+        thumb_url = Item.get("payload", {}).get("url", "")
+        actionable_text = Item.get("actionable_text", "")
+        uri = Item.get("uri", "")
+        item_type = Item.get("type", "")
+        item_message = Item.get("payload", {}).get("message", "")
+        if item_type.lower() == "app_action" and uri.lower() == "link":
+            if ".pdf" in thumb_url or ".docx" in thumb_url:
+                item_json = {
+                    "type": "openUrl",
+                    "title": f"{actionable_text} 📎",
+                    "value": thumb_url
+                }
+                item_list.append(item_json)
+                if ".pdf" in thumb_url:
+                    file_type = "pdf"
                 else:
-                    item_json = {
-                        "type": "openUrl",
-                        "title": f"{actionable_text} 🔗",
-                        "value": thumb_url
-                    }
-                    item_list.append(item_json)
-            elif item_type.lower() == "text_only":
+                    file_type = "docx"
+                attachments.append((file_type, actionable_text, thumb_url))
+            else:
                 item_json = {
-                    "type": "imBack",
-                    "title": f"{actionable_text} 💬",
-                    "value": item_message
+                    "type": "openUrl",
+                    "title": f"{actionable_text} 🔗",
+                    "value": thumb_url
                 }
                 item_list.append(item_json)
+        elif item_type.lower() == "text_only":
+            item_json = {
+                "type": "imBack",
+                "title": f"{actionable_text} 💬",
+                "value": item_message
+            }
+            item_list.append(item_json)
+    return item_list, attachments
 
-        if message:
-            message = message
+
+def collect_carousel_images(payload):
+    """
+    Returns the (url, title) of every png/jpeg/jpg image of a CAROUSEL message
+    """
+    images = []
+    attachment_list = payload.get("message", {}).get(
+        "body", {}).get("data", {}).get("items", [])
+    for attachments in attachment_list:
+        img_url = attachments.get("thumbnail", {}).get("image", "NA")
+        title = attachments.get("title", "Attachment File")
+        if ".png" in img_url or ".jpeg" in img_url or ".jpg" in img_url:
+            images.append((img_url, title + ".png"))
         else:
-            message = "You can click the below button to download the file."
-    elif "CAROUSEL" in message_type:
-        logger.info("Invoking Attachment consent to forward the Attachment")
-        attachment_list = payload.get("message", {}).get(
-            "body", {}).get("data", {}).get("items", [])
-        for attachments in attachment_list:
-            img_url = attachments.get("thumbnail", {}).get("image", "NA")
-            title = attachments.get("title", "Attachment File")
-            if ".png" in img_url or ".jpeg" in img_url or ".jpg" in img_url:
-                title = title + ".png"
-                send_image_teams(creds, conversation_id, img_url, title)
-                store_message_in_DB("IMAGE", conversation_id, agent_name)
-                ticket_attachment_invoke(
-                    "png", itsm, auth_id, conversation_id, client_id, email, title, img_url)
-            else:
-                logger.info(
-                    f"File extension not recognised. Only accepts png, jpeg, jpg\n{img_url}")
-        return
-    if is_translation:
-        logger.info("is_translation is True. Translation function is called")
-        message = handle_message_translation(message, auth_id)
-    if item_list:
-        send_button_message_to_teams(
-            item_list, creds, conversation_id, message)
-        store_message_in_DB(message, conversation_id, agent_name)
-    else:
-        send_message_to_teams(creds, conversation_id, message)
-        store_message_in_DB(message, conversation_id, agent_name)
+            logger.info(
+                f"File extension not recognised. Only accepts png, jpeg, jpg\n{img_url}")
+    return images
 
 
 def get_image_size(img_url):
     logger.info("Getting the size of the Image")
-    response = requests.head(img_url)
+    response = http_helper.request("HEAD", img_url)
     return response.headers["content-length"]
 
 
-def handle_resolution_event(is_translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id):
+def handle_resolution_event(translation, creds, payload, auth_id, is_automated, itsm, client_id, conversation_id):
     """
-    Handles webhook_conversation_complete event
+    Handles webhook_conversation_complete event.
+    The Haptik transcript fetch and the Teams completion notice run concurrently; only the ticket waits for both.
     """
     user_name = payload.get("user", {}).get("user_name")
     conversation_number = payload.get("data", {}).get("conversation_no")
 
-    chat_text = get_chat_transcripts(creds, user_name, conversation_number)
-    logger.debug(chat_text)
-
     try:
         agent_name = payload.get("agent", {}).get("name").title()
     except AttributeError:
         agent_name = "BOT"
 
-    message = "----- *This conversation is marked as completed* -----"
+    def fetch_transcript():
+        # A failed fetch is handled like a non-200 answer: the ticket still goes out, without the transcript,
+        # so the event completes once instead of posting the completion notice again on every retry
+        try:
+            chat_transcript = get_chat_transcripts(creds, user_name, conversation_number)
+        except Exception as ex:
+            logger.error(f"Exception raised while fetching the chat transcript: {ex}")
+            return None
+        if chat_transcript is not None:
+            verbose("Chat transcript: %s", chat_transcript.text or chat_transcript.location)
+        return chat_transcript
+
+    def send_completion_notice():
+        message = "----- *This conversation is marked as completed* -----"
+        message = translation.translate(message)
+        if send_message_to_teams(creds, conversation_id, message) is not None:
+            store_message_in_DB(message, conversation_id, agent_name)
+
+    def send_ticket(chat_transcript, _):
+        ticket_data = resolution_ticket_data(itsm, client_id, conversation_id, chat_transcript, is_automated)
+        verbose("Data being passed to ticketing function is: %s", ticket_data)
+        invoke_async(os.environ.get("ticketing_handler_arn"), ticket_data)
+
+    run_task_graph({
+        "transcript": (fetch_transcript, []),
+        "notice": (send_completion_notice, []),
+        "ticket": (send_ticket, ["transcript", "notice"])
+    })
 
-    if is_translation:
-        logger.info("is_translation is True. Translation function is called")
-        message = handle_message_translation(message, auth_id)
-    send_message_to_teams(creds, conversation_id, message)
-    store_message_in_DB(message, conversation_id, agent_name)
+
+def store_message_in_DB(message, con_id, agent_name):
+    """
+    Stores the Chat message in the DB as its own chat transcript item, if the conversation's mapping exists.
+    Inside lambda_handler the write is buffered and flushed with the rest of the invocation's writes.
+    """
+    # The mapping is read once per invocation, so only the first message of an event pays for the check
+    if not get_user_mapping(con_id):
+        logger.error(f"User: {con_id} not found in the Table")
+        return
+    append_transcript(message, con_id, agent_name)
+    return
+
+
+def resolution_ticket_data(itsm, client_id, conversation_id, chat_transcript, is_automated):
+    """
+    A transcript offloaded to S3 is passed as chat_history_location (bucket, key, content_encoding, size)
+    with chat_history set to None
+    """
     ticket_data = {
         "itsm": itsm,
         "payload": {
@@ -273,40 +410,17 @@ def handle_resolution_event(is_translation, creds, payload, auth_id, is_automate
             "source": "teams",
             "event": "TICKET_RESOLUTION",
             "conversation_id": conversation_id,
-            "chat_history": chat_text,
+            "chat_history": chat_transcript.text if chat_transcript is not None else None,
             "is_automated": is_automated
         }
     }
-    logger.debug(f"Data being passed to ticketing function is: {ticket_data}")
-    lambda_client.invoke(FunctionName=os.environ.get("ticketing_handler_arn"),
-                         InvocationType="Event",
-                         Payload=json.dumps(ticket_data))
-
-
-def store_message_in_DB(message, con_id, agent_name):
-    """
-    Stores the Chat message in the DB as chat_transcript.
-    """
-    response = user_mapping_table.get_item(Key={"con_id": con_id})
-    if "Item" not in response:
-        logger.error(f"User: {con_id} not found in the Table")
-        return
-    chat_transcript = response.get("Item", {}).get("chat_transcript")
-    formatted_time = datetime.now().strftime("%H:%M:%S %d-%m-%Y")
-    message = f"{formatted_time} [{agent_name}]: {message}"
-    if chat_transcript:
-        message = f"{chat_transcript}\n{message}"
-
-    user_mapping_table.update_item(Key={"con_id": con_id},
-                                   UpdateExpression="set chat_transcript=:i",
-                                   ExpressionAttributeValues={
-        ":i": message
-    })
-    return
+    if chat_transcript is not None and chat_transcript.location is not None:
+        ticket_data["payload"]["chat_history_location"] = chat_transcript.location
+    return ticket_data
 
 
-def ticket_attachment_invoke(file_type, itsm, auth_id, conversation_id, client_id, email, title, img_url):
-    ticket_data = {
+def attachment_ticket_data(file_type, itsm, auth_id, conversation_id, client_id, email, title, img_url):
+    return {
         "itsm": itsm,
         "payload": {
             "event": "TICKET_ATTACHMENT",
@@ -322,26 +436,55 @@ def ticket_attachment_invoke(file_type, itsm, auth_id, conversation_id, client_i
         }
     }
 
-    logger.info(
-        f"Data being passed to ticketing function is: {ticket_data}")
-    lambda_client.invoke(FunctionName=os.environ.get("ticketing_handler_arn"),
-                         InvocationType="Event",
-                         Payload=json.dumps(ticket_data))
+
+def ticket_attachment_invoke(file_type, itsm, auth_id, conversation_id, client_id, email, title, img_url):
+    ticket_data = attachment_ticket_data(file_type, itsm, auth_id, conversation_id, client_id, email, title, img_url)
+    verbose("Data being passed to ticketing function is: %s", ticket_data)
+    invoke_async(os.environ.get("ticketing_handler_arn"), ticket_data)
 
 
-def handle_kendra_search(item_list: list, query: str, creds: dict, conversation_id: str, agent_name: str):
+def handle_kendra_search(item_list: list, query: str, creds: dict, conversation_id: str, agent_name: str,
+                         translation=None):
     """
     When bot break or disamb message is sent it will query Kendra for results
     """
-    message, link = search_kendra(query)
+    message, links = search_kendra(query)
+    new_list = build_kendra_items(item_list, links)
+    if translation is not None:
+        message = translation.translate_card(message, new_list)
+    verbose("Kendra buttons: %s", new_list)
+    if send_button_message_to_teams(new_list, creds, conversation_id, message) is not None:
+        store_message_in_DB(message, conversation_id, agent_name)
+
+
+def build_kendra_items(item_list, links):
+    """
+    Puts one "Visit Link" button per Kendra link before the item_list buttons. The links only take the button
+    space the card has left, and item_list is cut to the card limit keeping its first, "Talk to an Agent", button.
+    """
+    item_list = item_list[:TEAMS_MAX_CARD_BUTTONS]
+    links = links[:TEAMS_MAX_CARD_BUTTONS - len(item_list)]
     new_list = []
-    if link:
+    for position, link in enumerate(links, start=1):
         new_list.append({
             "type": "openUrl",
-            "title": "Visit Link 🔗",
+            "title": "Visit Link 🔗" if position == 1 else f"Visit Link {position} 🔗",
             "value": link
         })
     new_list.extend(item_list)
-    logger.info(new_list)
-    send_button_message_to_teams(new_list, creds, conversation_id, message)
-    store_message_in_DB(message, conversation_id, agent_name)
+    return new_list
+
+
+# Handlers by exact event_name; events missing here are rejected before any lookup
+EVENT_HANDLERS = {
+    "message": route_message_event,
+    "chat_pinned": route_pinned_event,
+    "webhook_conversation_complete": route_resolution_event
+}
+
+# Handlers by exact message type; other types are sent as text. A handler returns the buttons and message
+# to send, or None when it sent everything itself.
+MESSAGE_TYPE_HANDLERS = {
+    "BUTTON": handle_button_message,
+    "CAROUSEL": handle_carousel_message
+}
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import random
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Characters of a payload that make it into the log; the rest is replaced by a marker with the full size
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get("log_payload_max_chars", "1000"))
+# Verbose records (payload dumps) are logged for 1 in log_sample_rate calls; 1 logs all of them, 0 none
+LOG_SAMPLE_RATE = int(os.environ.get("log_sample_rate", "100"))
+
+REDACTED_KEYS = frozenset(("teams_client_secret", "bot_chat_auth", "client_secret", "access_token", "Authorization"))
+REDACTED = "***"
+
+
+class Payload:
+    """
+    Wraps a value passed as a logging argument. It is only redacted, serialized and truncated
+    if the record is actually emitted, so a filtered record costs nothing beyond the wrapper.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return format_payload(self.value)
+
+
+def format_payload(value, max_chars=None):
+    """
+    Returns the value as log text with secrets redacted, cut to max_chars (log_payload_max_chars by default)
+    """
+    max_chars = LOG_PAYLOAD_MAX_CHARS if max_chars is None else max_chars
+    if hasattr(value, "to_dict"):
+        # Prebuilt activities are logged as the activity they hold
+        value = value.to_dict()
+    value = redact(value)
+    if isinstance(value, str):
+        text = value
+    else:
+        try:
+            text = json.dumps(value, default=str, ensure_ascii=False)
+        except (TypeError, ValueError):
+            text = str(value)
+    if len(text) > max_chars:
+        return f"{text[:max_chars]}...[truncated, {len(text)} chars]"
+    return text
+
+
+def redact(value):
+    """
+    Returns a copy of dicts and lists with the values of secret keys masked; other values are returned as is
+    """
+    if isinstance(value, dict):
+        return {key: REDACTED if key in REDACTED_KEYS else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def sampled():
+    return LOG_SAMPLE_RATE > 0 and (LOG_SAMPLE_RATE == 1 or random.randrange(LOG_SAMPLE_RATE) == 0)
+
+
+def verbose(message, *payloads):
+    """
+    Logs a verbose record, e.g. a payload dump, for a sample of the calls.
+    The payloads are wrapped in Payload and only formatted when the record is emitted.
+    """
+    if logger.isEnabledFor(logging.INFO) and sampled():
+        logger.info(message, *(Payload(payload) for payload in payloads))
@@ -0,0 +1,120 @@
+import aws_helper
+import gzip
+import json
+import logging
+import os
+import tempfile
+from tracing import current_client_id, current_trace_id, span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# S3 location ("s3://bucket/prefix") transcripts too large for the ticket payload are offloaded to; unset truncates them
+TRANSCRIPT_OFFLOAD_LOCATION = os.environ.get("transcript_offload_location", "")
+# JSON-encoded size up to which a transcript travels inline; async Lambda invokes are capped at 256KB
+CHAT_HISTORY_INLINE_BYTES = int(os.environ.get("chat_history_inline_bytes", "204800"))
+# UTF-8 size after which the rest of a transcript is dropped, bounding the spool on /tmp
+CHAT_HISTORY_MAX_BYTES = int(os.environ.get("chat_history_max_bytes", str(64 * 1024 * 1024)))
+# Compressed bytes kept in memory before the spool moves to a temporary file
+SPOOL_MEMORY_BYTES = int(os.environ.get("transcript_spool_memory_bytes", str(1024 * 1024)))
+
+TRUNCATION_NOTICE = "\n----- Transcript truncated -----"
+
+
+class ChatTranscript:
+    """
+    A fetched chat transcript: its text when it fits the ticket payload, else the S3 location it was offloaded to
+    """
+    __slots__ = ("text", "location", "size", "truncated")
+
+    def __init__(self, text=None, location=None, size=0, truncated=False):
+        self.text = text
+        self.location = location
+        self.size = size
+        self.truncated = truncated
+
+
+class TranscriptSpool:
+    """
+    Collects a transcript piece by piece. It is held in memory up to CHAT_HISTORY_INLINE_BYTES; past that it is
+    gzip-compressed into a spooled temporary file, so memory stays flat however long the chat was.
+    """
+
+    def __init__(self):
+        self.pieces = []
+        self.inline_bytes = 0
+        self.size = 0
+        self.truncated = False
+        self.file = None
+        self.gzip = None
+
+    def write(self, text):
+        """
+        Adds the next piece of the transcript. Returns False once the spool takes no more.
+        """
+        if self.truncated:
+            return False
+        data = text.encode("utf-8", "replace")
+        if self.size + len(data) > CHAT_HISTORY_MAX_BYTES:
+            text = data[:CHAT_HISTORY_MAX_BYTES - self.size].decode("utf-8", "ignore")
+            data = text.encode("utf-8")
+            self.truncated = True
+            logger.error(f"Chat transcript exceeds {CHAT_HISTORY_MAX_BYTES} bytes, the rest was dropped")
+        self.size += len(data)
+        if self.gzip is not None:
+            self.gzip.write(data)
+        else:
+            self.pieces.append(text)
+            # json.dumps escapes quotes, newlines and non-ASCII characters, so measure the size as it will be sent
+            self.inline_bytes += len(json.dumps(self.pieces[-1])) - 2
+            if self.inline_bytes > CHAT_HISTORY_INLINE_BYTES:
+                self._spill()
+        return not self.truncated
+
+    def finish(self):
+        """
+        Returns the ChatTranscript: inline when it fits, otherwise offloaded to TRANSCRIPT_OFFLOAD_LOCATION
+        """
+        if self.gzip is None:
+            return ChatTranscript("".join(self.pieces), size=self.size, truncated=self.truncated)
+        if self.truncated:
+            self.gzip.write(TRUNCATION_NOTICE.encode("utf-8"))
+        self.gzip.close()
+        try:
+            location = offload(self.file, self.size)
+        finally:
+            self.file.close()
+        return ChatTranscript(location=location, size=self.size, truncated=self.truncated)
+
+    def _spill(self):
+        if not TRANSCRIPT_OFFLOAD_LOCATION:
+            # Nowhere to offload to: keep what fits inline rather than fail the invoke
+            logger.error("Chat transcript exceeds chat_history_inline_bytes and transcript_offload_location is "
+                         "not set, truncating it")
+            text = "".join(self.pieces)
+            while len(json.dumps(text)) - 2 > CHAT_HISTORY_INLINE_BYTES - len(TRUNCATION_NOTICE):
+                text = text[:len(text) * 9 // 10]
+            self.pieces = [text + TRUNCATION_NOTICE]
+            self.truncated = True
+            return
+        self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+        self.gzip = gzip.GzipFile(fileobj=self.file, mode="wb", compresslevel=6)
+        for piece in self.pieces:
+            self.gzip.write(piece.encode("utf-8", "replace"))
+        self.pieces = []
+
+
+def offload(fileobj, size):
+    """
+    Uploads the gzip-compressed transcript to TRANSCRIPT_OFFLOAD_LOCATION and returns the pointer to pass on
+    """
+    bucket, _, prefix = TRANSCRIPT_OFFLOAD_LOCATION[len("s3://"):].partition("/")
+    key = f"{prefix.rstrip('/')}/{current_client_id()}/{current_trace_id()}.txt.gz".lstrip("/")
+    compressed_size = fileobj.tell()
+    fileobj.seek(0)
+    with span("s3", "offload_transcript"):
+        aws_helper.client("s3").upload_fileobj(fileobj, bucket, key, ExtraArgs={
+            "ContentType": "text/plain; charset=utf-8", "ContentEncoding": "gzip"})
+    logger.info(f"Offloaded a {size} byte chat transcript to s3://{bucket}/{key} ({compressed_size} bytes gzipped)")
+    return {"bucket": bucket, "key": key, "content_encoding": "gzip", "size": size,
+            "compressed_size": compressed_size}
@@ -2,19 +2,65 @@ import cProfile
 import pstats
 import io
 import logging
+import os
+import random
+import time
+import aws_helper
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
+
+# Profile 1 in profile_sample_rate invocations with cProfile; 0 turns profiling off
+PROFILE_SAMPLE_RATE = int(os.environ.get("profile_sample_rate", "0"))
+# Directory ("/tmp") or S3 location ("s3://bucket/prefix") the pstats dumps of sampled invocations are written to
+PROFILE_OUTPUT = os.environ.get("profile_output", "")
+PROFILE_TOP_N = int(os.environ.get("profile_top_n", "20"))
+
+
 def profile(func):
+    # The time spent per dependency is reported by tracing, in the one EMF record of each event
     def wrapper(*args, **kwargs):
-        pr = cProfile.Profile()
-        pr.enable()
-        retval = func(*args, **kwargs)
-        pr.disable()
-        s = io.StringIO()
-        sortby = pstats.SortKey.CUMULATIVE  # 'cumulative'
-        ps = pstats.Stats(pr, stream=s).strip_dirs().sort_stats(sortby)
-        ps.print_stats(20)
-        logger.info(f"Profiling Results\n{s.getvalue()}")
-        return retval
+        pr = cProfile.Profile() if _is_sampled() else None
+        if pr:
+            pr.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if pr:
+                pr.disable()
+                export_profile(pr, _request_id(args))
     return wrapper
+
+
+def export_profile(pr, request_id):
+    """
+    Logs the top stats of a sampled invocation and writes its pstats dump to profile_output, if configured
+    """
+    s = io.StringIO()
+    sortby = pstats.SortKey.CUMULATIVE  # 'cumulative'
+    ps = pstats.Stats(pr, stream=s).strip_dirs().sort_stats(sortby)
+    ps.print_stats(PROFILE_TOP_N)
+    logger.info(f"Profiling Results\n{s.getvalue()}")
+    if not PROFILE_OUTPUT:
+        return
+    file_name = f"profile-{request_id}.pstats"
+    try:
+        if PROFILE_OUTPUT.startswith("s3://"):
+            bucket, _, prefix = PROFILE_OUTPUT[len("s3://"):].partition("/")
+            path = os.path.join("/tmp", file_name)
+            pr.dump_stats(path)
+            aws_helper.client("s3").upload_file(path, bucket, f"{prefix.rstrip('/')}/{file_name}".lstrip("/"))
+            os.remove(path)
+        else:
+            pr.dump_stats(os.path.join(PROFILE_OUTPUT, file_name))
+    except Exception as ex:
+        logger.error(f"Exception raised while exporting the profile: {ex}")
+
+
+def _is_sampled():
+    return PROFILE_SAMPLE_RATE > 0 and random.randrange(PROFILE_SAMPLE_RATE) == 0
+
+
+def _request_id(args):
+    context = args[1] if len(args) > 1 else None
+    return getattr(context, "aws_request_id", None) or f"{int(time.time() * 1000)}"
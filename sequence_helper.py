@@ -0,0 +1,209 @@
+import aws_helper
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from tracing import span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+user_mapping_table = aws_helper.table("teams_mapping_table")
+
+# Events of one conversation are processed one at a time under a lease. The lease does not order them: events
+# reach the handler in order only from an SQS FIFO queue whose MessageGroupId is the conversation's con_id
+CONVERSATION_SEQUENCING = os.environ.get("conversation_sequencing", "true").lower() == "true"
+# Seconds a lease is held at most, so a crashed invocation cannot block its conversation for longer
+CONVERSATION_LEASE_TTL = int(os.environ.get("conversation_lease_ttl", "60"))
+# Seconds between the renewals that keep the lease of a running event from expiring
+CONVERSATION_LEASE_RENEW = float(os.environ.get("conversation_lease_renew", str(CONVERSATION_LEASE_TTL / 3)))
+# Seconds an event waits for the lease before it fails and is retried
+CONVERSATION_LEASE_WAIT = float(os.environ.get("conversation_lease_wait", "10"))
+# Times a failed release is written before the lease is left to expire
+CONVERSATION_RELEASE_ATTEMPTS = int(os.environ.get("conversation_release_attempts", "3"))
+# Ids of the last processed events kept per conversation to drop redelivered ones
+CONVERSATION_DEDUPE_WINDOW = int(os.environ.get("conversation_dedupe_window", "20"))
+
+# The lease lives on its own small user_mapping_table item, so taking and releasing it neither returns nor is
+# billed on the conversation's item with its legacy chat_transcript
+LEASE_KEY_PREFIX = "lease#"
+
+_current_lease = contextvars.ContextVar("conversation_lease", default=None)
+
+
+class ConversationBusyError(Exception):
+    """
+    Raised when the lease of a conversation could not be taken within conversation_lease_wait seconds
+    """
+
+
+class ConversationLease:
+    """
+    The right to process the next event of a conversation. Hands out transcript sort keys that are strictly
+    increasing across the conversation's events, whichever container or clock they ran on.
+    """
+
+    def __init__(self, con_id, event_id, owner, last_seq_ns, recent_event_ids):
+        self.con_id = con_id
+        self.event_id = event_id
+        self.owner = owner
+        self.last_seq_ns = last_seq_ns
+        self.recent_event_ids = recent_event_ids
+        self.lock = threading.Lock()
+        # Set once a renewal finds the lease taken over after it expired
+        self.lost = False
+        self._stopped = threading.Event()
+
+    @property
+    def duplicate(self):
+        return self.event_id is not None and self.event_id in self.recent_event_ids
+
+    def next_sequence(self):
+        # The event's tasks may store messages from several threads at once
+        with self.lock:
+            self.last_seq_ns = max(time.time_ns(), self.last_seq_ns + 1)
+            return f"{self.last_seq_ns:020d}#{self.owner[:8]}"
+
+
+def current():
+    """
+    Returns the lease of the conversation the running event holds, or None
+    """
+    return _current_lease.get()
+
+
+@contextmanager
+def conversation_lease(con_id, event_id=None):
+    """
+    Holds the conversation's lease for the block, so its events are handled one at a time while other
+    conversations run freely. The lease is renewed every conversation_lease_renew seconds until the block
+    exits, however long its sends take. The event id is remembered when the block completes; check lease.duplicate to
+    skip an event that was already processed. Yields None when conversation_sequencing is off.
+    """
+    if not CONVERSATION_SEQUENCING:
+        yield None
+        return
+    lease = acquire(con_id, event_id)
+    token = _current_lease.set(lease)
+    # The renewals run on their own thread, in the event's context so their spans count towards its trace
+    keep_alive = threading.Thread(target=contextvars.copy_context().run, args=(_keep_alive, lease), daemon=True)
+    keep_alive.start()
+    completed = False
+    try:
+        yield lease
+        completed = True
+    finally:
+        lease._stopped.set()
+        keep_alive.join()
+        _current_lease.reset(token)
+        release(lease, completed)
+
+
+def acquire(con_id, event_id=None):
+    """
+    Takes the lease with a conditional write, waiting with jittered backoff while another event holds it
+    """
+    from botocore.exceptions import ClientError
+    owner = uuid.uuid4().hex
+    deadline = time.time() + CONVERSATION_LEASE_WAIT
+    attempt = 0
+    while True:
+        now = time.time()
+        with span("dynamodb", "acquire_lease") as sp:
+            try:
+                response = sp.record_aws_response(user_mapping_table.update_item(
+                    Key={"con_id": lease_key(con_id)},
+                    UpdateExpression="set lock_owner = :owner, lock_expires = :expires",
+                    ConditionExpression="attribute_not_exists(lock_owner) OR lock_expires < :now",
+                    ExpressionAttributeValues={":owner": owner, ":expires": int(now) + CONVERSATION_LEASE_TTL,
+                                               ":now": int(now)},
+                    ReturnValues="ALL_NEW"))
+            except ClientError as ex:
+                if ex.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    raise
+                # Another event holds the lease; waiting for it is not a DynamoDB error
+                response = None
+        if response is not None:
+            item = response.get("Attributes", {})
+            return ConversationLease(con_id, event_id, owner, int(item.get("last_seq_ns", 0)),
+                                     list(item.get("recent_event_ids", [])))
+        if now >= deadline:
+            raise ConversationBusyError(f"Conversation {con_id} is busy")
+        attempt += 1
+        time.sleep(min(1.0, 0.02 * (2 ** attempt)) * random.uniform(0.5, 1.0))
+
+
+def renew(lease):
+    """
+    Pushes the lease's expiry conversation_lease_ttl seconds ahead. Returns False when another event took
+    the lease over, after it had expired.
+    """
+    from botocore.exceptions import ClientError
+    try:
+        with span("dynamodb", "renew_lease") as sp:
+            sp.record_aws_response(user_mapping_table.update_item(
+                Key={"con_id": lease_key(lease.con_id)},
+                UpdateExpression="set lock_expires = :expires",
+                ConditionExpression="lock_owner = :owner",
+                ExpressionAttributeValues={":expires": int(time.time()) + CONVERSATION_LEASE_TTL,
+                                           ":owner": lease.owner}))
+    except ClientError as ex:
+        if ex.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+        return False
+    return True
+
+
+def _keep_alive(lease):
+    while not lease._stopped.wait(CONVERSATION_LEASE_RENEW):
+        try:
+            if not renew(lease):
+                lease.lost = True
+                logger.error(f"Lost the lease of conversation {lease.con_id} while its event was running")
+                return
+        except Exception as ex:
+            # The next renewal tries again while the lease has not expired yet
+            logger.error(f"Exception raised while renewing the lease of conversation {lease.con_id}: {ex}")
+
+
+def lease_key(con_id):
+    return f"{LEASE_KEY_PREFIX}{con_id}"
+
+
+def release(lease, completed=True):
+    """
+    Gives the lease back and stores the last transcript sequence. A completed event's id is remembered so a
+    redelivery of it is skipped; a failed one is left out so its retry runs again. Failed writes are retried,
+    as a release that is never stored lets a redelivery of the completed event run again.
+    """
+    from botocore.exceptions import ClientError
+    if lease.lost:
+        logger.error(f"Not releasing the lease of conversation {lease.con_id}, another event holds it")
+        return
+    recent_event_ids = lease.recent_event_ids
+    if completed and lease.event_id is not None and lease.event_id not in recent_event_ids:
+        recent_event_ids = (recent_event_ids + [lease.event_id])[-CONVERSATION_DEDUPE_WINDOW:]
+    for attempt in range(CONVERSATION_RELEASE_ATTEMPTS):
+        try:
+            with span("dynamodb", "release_lease") as sp:
+                sp.record_aws_response(user_mapping_table.update_item(
+                    Key={"con_id": lease_key(lease.con_id)},
+                    UpdateExpression="set lock_expires = :released, last_seq_ns = :seq, recent_event_ids = :ids",
+                    ConditionExpression="lock_owner = :owner",
+                    ExpressionAttributeValues={":released": 0, ":seq": lease.last_seq_ns, ":ids": recent_event_ids,
+                                               ":owner": lease.owner}))
+            return
+        except ClientError as ex:
+            if ex.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                logger.error(f"Not releasing the lease of conversation {lease.con_id}, another event holds it")
+                return
+            logger.error(f"Exception raised while releasing the lease of conversation {lease.con_id}: {ex}")
+        except Exception as ex:
+            logger.error(f"Exception raised while releasing the lease of conversation {lease.con_id}: {ex}")
+        time.sleep(min(1.0, 0.05 * (2 ** attempt)) * random.uniform(0.5, 1.0))
+    # The lease expires on its own after conversation_lease_ttl
@@ -1,28 +1,37 @@
-import requests
 import logging
-import os
-import json
+import teams_sender
+from activity_builder import button_activity, consent_activity, image_activity, message_activity
+from log_helper import verbose
+from token_helper import get_auth_token
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def activity_id(response):
+    """
+    Returns the id of the activity Teams accepted ("" when the response names none), or None when it was rejected.
+    Callers only store a transcript line for an activity that was not None.
+    """
+    if response.status_code >= 400:
+        return None
+    try:
+        return response.json().get("id", "")
+    except ValueError:
+        return ""
+
+
 def send_message_to_teams(creds, conversation_id, message):
     # Sends message to Teams
-    auth_token = generate_auth_token(creds)
-    BASE_URL = creds['teams_base_url']
-    send_message_url = f"{BASE_URL}/conversations/{conversation_id}/activities"
-    data = {"type": "message", "text": message}
-    headers = {"Authorization": auth_token, "Content-Type": "application/json"}
-    logger.info(f"Trying to send a message to Teams: {message}")
+    data = message_activity(message)
+    verbose("Trying to send a message to Teams: %s", message)
     try:
-        response = requests.request(
-            "POST", send_message_url, headers=headers, json=data
-        )
-        logger.info(f"Send Message to Teams Response status: {response.status_code}")
-        logger.info(f"Send Message to Teams Payload: {data}")
-        if response.status_code == 201:
-            return response.json().get("id")
+        response = teams_sender.post_activity(creds, conversation_id, data, "send_message")
+        if response is None:
+            return
+        logger.info("Send Message to Teams Response status: %s", response.status_code)
+        verbose("Send Message to Teams Payload: %s", data)
+        return activity_id(response)
     except Exception as ex:
         logger.error(f"Exception raised while sending the message to the conversation: {ex}")
 
@@ -30,31 +39,15 @@ def send_button_message_to_teams(item_list, creds, conversation_id, message):
     """
     Sends message to Teams
     """
-    auth_token = generate_auth_token(creds)
-    BASE_URL = creds['teams_base_url']
-    send_message_url = f"{BASE_URL}/conversations/{conversation_id}/activities"
-    data = {
-        "type":"message",
-        "attachments":[
-            {
-                "contentType":"application/vnd.microsoft.card.hero",
-                "content":{
-                    "text":message,
-                    "buttons": item_list
-                }
-            }
-        ]
-    }
-    headers = {"Authorization": auth_token, "Content-Type": "application/json"}
-    logger.info(f"Trying to send a buttons to Teams: {message}")
+    data = button_activity(item_list, message)
+    verbose("Trying to send a buttons to Teams: %s", message)
     try:
-        response = requests.request(
-            "POST", send_message_url, headers=headers, json=data
-        )
-        logger.info(f"Send Button to Teams Response status: {response.status_code}")
-        logger.info(f"Send Button to Teams Payload: {data}")
-        if response.status_code == 201:
-            return response.json().get("id")
+        response = teams_sender.post_activity(creds, conversation_id, data, "send_buttons")
+        if response is None:
+            return
+        logger.info("Send Button to Teams Response status: %s", response.status_code)
+        verbose("Send Button to Teams Payload: %s", data)
+        return activity_id(response)
     except Exception as ex:
         logger.error(f"Exception raised while sending the message to the conversation: {ex}")
 
@@ -63,53 +56,21 @@ def send_consent(creds, conversation_id, title, image_size):
     Sends consent to the Teams user to either accept or decline the upload of the Attachment
     """
     logger.info("Sending Consent to Teams")
-    auth_token = generate_auth_token(creds)
-    BASE_URL = creds['teams_base_url']
-    send_consent_url = f"{BASE_URL}/conversations/{conversation_id}/activities"
-    data = {
-        "type": "message",
-        "attachments": [{
-            "contentType": "application/vnd.microsoft.teams.card.file.consent",
-            "name": title,
-            "content": {
-                "description": "Consent",
-                "sizeInBytes": image_size,
-                "acceptContext": {},
-                "declineContext": {}
-            }
-        }]
-    }
-    headers = {"Authorization": auth_token, "Content-Type": "application/json"}
+    data = consent_activity(title, image_size)
     logger.info("Trying to send a Consent to Teams")
     try:
-        response = requests.request(
-            "POST", send_consent_url, headers=headers, json=data
-        )
-        if response.status_code == 201:
-            return response.json().get("id")
+        response = teams_sender.post_activity(creds, conversation_id, data, "send_consent")
+        if response is not None:
+            return activity_id(response)
     except Exception as ex:
         logger.error(f"Exception raised while sending consent to the conversation: {ex}")
 
 
 def generate_auth_token(creds):
     """
-    Generates the auth token
+    Generates the auth token, reusing the cached token for these creds while it is still valid
     """
-    url = os.environ.get('auth_token_url')
-
-    payload = {
-        "grant_type": "client_credentials",
-        "client_id": creds["teams_client_id"],
-        "client_secret": creds["teams_client_secret"],
-        "scope": creds["teams_scope"]
-    }
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-    if response.status_code == 200:
-        return "Bearer " + response.json().get("access_token")
-    else:
-        logger.error(f"couldn't generate auth token:\n{response.text}")
+    return get_auth_token(creds)
 
 
 def send_image_teams(creds, conversation_id, image_url, image_title):
@@ -117,55 +78,25 @@ def send_image_teams(creds, conversation_id, image_url, image_title):
     Sends Images to Teams
     """
     logger.info("Sending Consent to Teams")
-    auth_token = generate_auth_token(creds)
-    BASE_URL = creds['teams_base_url']
-    send_image_teams_url = f"{BASE_URL}/conversations/{conversation_id}/activities"
-    data = json.dumps({
-        "type":"message",
-        "text":"",
-        "attachments":[
-            {
-                "contentType":"image/png",
-                "contentUrl": image_url,
-                "name": image_title
-            }
-        ]
-    })
-    headers = {"Authorization": auth_token, "Content-Type": "application/json"}
+    data = image_activity(image_url, image_title)
     logger.info("Trying to send a Image to Teams")
     try:
-        response = requests.request("POST", send_image_teams_url, headers=headers, data=data)
-        if response.status_code == 201:
-            return response.json().get("id")
+        response = teams_sender.post_activity(creds, conversation_id, data, "send_image")
+        if response is not None:
+            return activity_id(response)
     except Exception as ex:
         logger.error(f"Exception raised while sending image to the conversation: {ex}")
 
-def teams_button_payload(message, thumb_url):
-    data = {
-        "type":"message",
-        "text":"",
-        "attachments":[
-            {
-                "contentType":"application/vnd.microsoft.card.adaptive",
-                "content":{
-                    "type":"AdaptiveCard",
-                    "version":"1.0",
-                    "body":[
-                    {
-                        "type":"TextBlock",
-                        "text":message,
-                        "separation":"none"
-                    }
-                    ],
-                    "actions":[
-                    {
-                        "type":"Action.OpenUrl",
-                        "url":thumb_url,
-                        "title":"Click here"
-                    }
-                    ]
-                }
-            }
-        ]
-    }
-    return data
+
+async def post_activity_async(creds, conversation_id, data):
+    """
+    Posts the activity to the conversation through the async HTTP client and returns its id
+    """
+    try:
+        response = await teams_sender.post_activity_async(creds, conversation_id, data)
+        if response is None:
+            return
+        logger.info("Send Activity to Teams Response status: %s", response.status_code)
+        return activity_id(response)
+    except Exception as ex:
+        logger.error(f"Exception raised while sending the activity to the conversation: {ex}")
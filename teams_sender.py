@@ -0,0 +1,311 @@
+import asyncio
+import aws_helper
+import json
+import logging
+import os
+import random
+import requests
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import activity_builder
+import async_helper
+import http_helper
+from cache_helper import TTLCache
+from token_helper import get_auth_token, invalidate_auth_token
+from tracing import current_client_id, span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Sustained activities per second and burst size per conversation, and per tenant (bot registration)
+TEAMS_CONVERSATION_RATE = float(os.environ.get("teams_conversation_rate", "7"))
+TEAMS_CONVERSATION_BURST = float(os.environ.get("teams_conversation_burst", "8"))
+TEAMS_TENANT_RATE = float(os.environ.get("teams_tenant_rate", "50"))
+TEAMS_TENANT_BURST = float(os.environ.get("teams_tenant_burst", "50"))
+TEAMS_LIMITER_CACHE_SIZE = int(os.environ.get("teams_limiter_cache_size", "1024"))
+TEAMS_MAX_RETRIES = int(os.environ.get("teams_max_retries", "4"))
+# Seconds one send may take in total, attempts and retry waits included, so a burst or an unreachable connector
+# cannot run the invocation into its timeout
+TEAMS_SEND_TIMEOUT = float(os.environ.get("teams_send_timeout", "20"))
+TEAMS_BACKOFF_FACTOR = float(os.environ.get("teams_backoff_factor", "0.5"))
+# Consecutive failures of a service url that open its circuit, and seconds it stays open
+TEAMS_BREAKER_THRESHOLD = int(os.environ.get("teams_breaker_threshold", "5"))
+TEAMS_BREAKER_COOLDOWN = float(os.environ.get("teams_breaker_cooldown", "30"))
+# SQS queue the default dead-letter hook sends dropped activities to; unset only logs them
+TEAMS_DEAD_LETTER_QUEUE_URL = os.environ.get("teams_dead_letter_queue_url", "")
+
+# 429 and 503 mean the connector did not accept the activity, so sending it again cannot duplicate it
+RETRY_STATUSES = (429, 503)
+
+_limiters = TTLCache(TEAMS_LIMITER_CACHE_SIZE)
+_breakers = {}
+_registry_lock = threading.Lock()
+_dead_letter_handler = None
+
+
+class TokenBucket:
+    """
+    Token bucket whose rate adapts to the connector: it halves on a 429 and creeps back up on every success
+    """
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns the seconds to wait before using it
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """
+    Stops sends to a service url after TEAMS_BREAKER_THRESHOLD consecutive failures. After the cooldown one
+    trial send is let through: its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < TEAMS_BREAKER_COOLDOWN or self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record(self, healthy):
+        with self.lock:
+            self.trial_running = False
+            if healthy:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= TEAMS_BREAKER_THRESHOLD or self.opened_at is not None:
+                    self.opened_at = time.monotonic()
+
+
+def post_activity(creds, conversation_id, activity, operation="send_activity"):
+    """
+    Posts the activity (an activity_builder.Activity or a dict) to the conversation within the rate limits,
+    retrying throttled sends. Returns the last response, or None when the send was dropped and handed to the
+    dead-letter hook, as are activities that still exceed the Teams limits after their buttons were trimmed.
+    """
+    try:
+        body = activity_builder.validate(activity)
+    except activity_builder.CardLimitError as ex:
+        return dead_letter(creds, conversation_id, activity, str(ex))
+    url = f"{creds['teams_base_url']}/conversations/{conversation_id}/activities"
+    breaker = get_breaker(creds["teams_base_url"])
+    deadline = time.monotonic() + TEAMS_SEND_TIMEOUT
+    token_renewed = False
+    response = None
+    for attempt in range(TEAMS_MAX_RETRIES + 1):
+        if not breaker.allow():
+            return dead_letter(creds, conversation_id, activity, "circuit open")
+        time.sleep(_reserve(creds, conversation_id))
+        headers = {"Authorization": get_auth_token(creds), "Content-Type": "application/json"}
+        try:
+            with span("teams", operation) as sp:
+                # The sender owns the retries, so the session must not retry the POST's connect errors as well
+                response = http_helper.request("POST", url, headers=headers, data=body, retry=False)
+                sp.record_response(response)
+        except Exception as ex:
+            breaker.record(False)
+            response = None
+            reason = f"{type(ex).__name__}: {ex}"
+            if not _is_connect_error(ex):
+                return dead_letter(creds, conversation_id, activity, reason)
+        else:
+            _record_outcome(creds, conversation_id, breaker, response.status_code)
+            if response.status_code == 401:
+                # The connector rejected the token: drop it from both cache tiers and retry once with a new one
+                invalidate_auth_token(creds, headers["Authorization"])
+                if not token_renewed:
+                    token_renewed = True
+                    reason = "status 401"
+                    continue
+            if response.status_code not in RETRY_STATUSES:
+                if response.status_code >= 400:
+                    dead_letter(creds, conversation_id, activity, f"status {response.status_code}")
+                return response
+            reason = f"status {response.status_code}"
+        delay = _retry_delay(response, attempt)
+        if attempt == TEAMS_MAX_RETRIES or time.monotonic() + delay >= deadline:
+            break
+        time.sleep(delay)
+    dead_letter(creds, conversation_id, activity, reason)
+    return response
+
+
+async def post_activity_async(creds, conversation_id, activity, operation="send_activity"):
+    """
+    Async variant of post_activity on the async HTTP client; the limiter and retry waits do not block the loop
+    """
+    try:
+        body = activity_builder.validate(activity)
+    except activity_builder.CardLimitError as ex:
+        return await async_helper.run_blocking(dead_letter, creds, conversation_id, activity, str(ex))
+    url = f"{creds['teams_base_url']}/conversations/{conversation_id}/activities"
+    breaker = get_breaker(creds["teams_base_url"])
+    deadline = time.monotonic() + TEAMS_SEND_TIMEOUT
+    token_renewed = False
+    response = None
+    for attempt in range(TEAMS_MAX_RETRIES + 1):
+        if not breaker.allow():
+            return await async_helper.run_blocking(dead_letter, creds, conversation_id, activity, "circuit open")
+        await asyncio.sleep(_reserve(creds, conversation_id))
+        auth_token = await async_helper.run_blocking(get_auth_token, creds)
+        headers = {"Authorization": auth_token, "Content-Type": "application/json"}
+        try:
+            with span("teams", operation) as sp:
+                response = await async_helper.request("POST", url, headers=headers, data=body, retry=False)
+                sp.record_response(response)
+        except Exception as ex:
+            breaker.record(False)
+            response = None
+            reason = f"{type(ex).__name__}: {ex}"
+            if not _is_connect_error(ex):
+                return await async_helper.run_blocking(dead_letter, creds, conversation_id, activity, reason)
+        else:
+            _record_outcome(creds, conversation_id, breaker, response.status_code)
+            if response.status_code == 401:
+                await async_helper.run_blocking(invalidate_auth_token, creds, headers["Authorization"])
+                if not token_renewed:
+                    token_renewed = True
+                    reason = "status 401"
+                    continue
+            if response.status_code not in RETRY_STATUSES:
+                if response.status_code >= 400:
+                    await async_helper.run_blocking(dead_letter, creds, conversation_id, activity,
+                                                    f"status {response.status_code}")
+                return response
+            reason = f"status {response.status_code}"
+        delay = _retry_delay(response, attempt)
+        if attempt == TEAMS_MAX_RETRIES or time.monotonic() + delay >= deadline:
+            break
+        await asyncio.sleep(delay)
+    await async_helper.run_blocking(dead_letter, creds, conversation_id, activity, reason)
+    return response
+
+
+def set_dead_letter_handler(handler):
+    """
+    Replaces the dead-letter hook. handler(record) receives the dict built by dead_letter; None restores the default.
+    """
+    global _dead_letter_handler
+    _dead_letter_handler = handler
+
+
+def dead_letter(creds, conversation_id, activity, reason):
+    """
+    Hands a dropped activity to the dead-letter hook so it can be replayed with replay_dead_letter. Returns None.
+    """
+    record = {
+        "client_id": current_client_id(),
+        "teams_base_url": creds["teams_base_url"],
+        "conversation_id": conversation_id,
+        "activity": activity_builder.as_dict(activity),
+        "reason": reason,
+        "dropped_at": int(time.time())
+    }
+    logger.error(f"Dropped activity for conversation {conversation_id}: {reason}")
+    try:
+        if _dead_letter_handler is not None:
+            _dead_letter_handler(record)
+        elif TEAMS_DEAD_LETTER_QUEUE_URL:
+            aws_helper.client("sqs").send_message(QueueUrl=TEAMS_DEAD_LETTER_QUEUE_URL, MessageBody=json.dumps(record))
+    except Exception as ex:
+        logger.error(f"Exception raised while dead-lettering the activity: {ex}")
+    return None
+
+
+def replay_dead_letter(record, creds):
+    """
+    Sends a dead-lettered activity again with the creds of its client. Returns the response, or None.
+    """
+    return post_activity(creds, record["conversation_id"], record["activity"], "replay_activity")
+
+
+def get_breaker(service_url):
+    with _registry_lock:
+        breaker = _breakers.get(service_url)
+        if breaker is None:
+            breaker = _breakers[service_url] = CircuitBreaker()
+    return breaker
+
+
+def get_limiters(creds, conversation_id):
+    """
+    Returns the token buckets of the tenant and of the conversation, kept in a bounded LRU
+    """
+    return [
+        _limiters.get_or_create(("tenant", creds.get("teams_client_id")),
+                                lambda: TokenBucket(TEAMS_TENANT_RATE, TEAMS_TENANT_BURST)),
+        _limiters.get_or_create(("conversation", conversation_id),
+                                lambda: TokenBucket(TEAMS_CONVERSATION_RATE, TEAMS_CONVERSATION_BURST)),
+    ]
+
+
+def _reserve(creds, conversation_id):
+    return max(bucket.reserve() for bucket in get_limiters(creds, conversation_id))
+
+
+def _record_outcome(creds, conversation_id, breaker, status_code):
+    # A 429 is the connector pacing us, not a sign that it is unhealthy
+    breaker.record(status_code < 500)
+    for bucket in get_limiters(creds, conversation_id):
+        if status_code == 429:
+            bucket.throttled()
+        elif status_code < 400:
+            bucket.succeeded()
+
+
+def _is_connect_error(ex):
+    # Only failures to reach the connector are retried; after a read timeout the activity may have been posted
+    if isinstance(ex, requests.ConnectionError):
+        return True
+    return async_helper.aiohttp is not None and isinstance(ex, async_helper.aiohttp.ClientConnectorError)
+
+
+def _retry_delay(response, attempt):
+    """
+    Seconds to wait before the next attempt: the Retry-After of the response when it has one, else exponential
+    backoff, plus up to 20% jitter so throttled senders do not retry in lockstep
+    """
+    delay = TEAMS_BACKOFF_FACTOR * (2 ** attempt)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return delay * random.uniform(1.0, 1.2)
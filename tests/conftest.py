@@ -0,0 +1,62 @@
+"""
+Runs the handler against the local stand-ins of benchmarks/stubs.py: a stub HTTP server for the token endpoint,
+Teams and Haptik, FakeTables for DynamoDB and fake Lambda, Kendra and S3 clients.
+
+Run from the repo root: python -m pytest tests
+"""
+import logging
+import os
+import re
+import pytest
+from benchmarks.stubs import add_conversation, configure_environment, install_stand_ins, start_stub_server, stub_routes
+
+configure_environment()
+# No EMF records on stdout, and Teams' rate limits do not pace the tests
+os.environ.setdefault("trace_metrics", "false")
+for name in ("teams_conversation_rate", "teams_conversation_burst", "teams_tenant_rate", "teams_tenant_burst"):
+    os.environ.setdefault(name, "100000")
+
+SERVER, BASE_URL = start_stub_server(stub_routes())
+STAND_INS = install_stand_ins(BASE_URL)
+logging.getLogger().setLevel(logging.WARNING)
+
+
+@pytest.fixture
+def stand_ins():
+    return STAND_INS
+
+
+@pytest.fixture
+def server():
+    return SERVER
+
+
+@pytest.fixture
+def base_url():
+    return BASE_URL
+
+
+@pytest.fixture
+def conversation(request):
+    """
+    Maps a user of its own to a new conversation and returns the user's auth_id
+    """
+    name = re.sub(r"\W", "-", request.node.name)
+    auth_id = f"user-{name}"
+    add_conversation(STAND_INS, auth_id, f"conversation-{name}")
+    return auth_id
+
+
+@pytest.fixture
+def translation(request):
+    """
+    Turns translation on or off for the bench client, with empty translation caches
+    """
+    import db_helper
+    import translation_helper
+    STAND_INS["client_mapping_table"].items[("bench",)]["is_translation"] = request.param
+    db_helper.invalidate_client_config()
+    translation_helper.clear_translation_cache()
+    yield request.param
+    STAND_INS["client_mapping_table"].items[("bench",)]["is_translation"] = True
+    db_helper.invalidate_client_config()
@@ -0,0 +1,59 @@
+"""
+A token the connector rejects is dropped and requested again once, and the token cache follows secret rotations
+"""
+import pytest
+
+
+@pytest.fixture
+def creds(base_url, request):
+    import token_helper
+    token_helper.clear_token_cache()
+    return {"teams_base_url": base_url, "teams_client_id": f"client-{request.node.name}",
+            "teams_client_secret": "secret", "teams_scope": "scope"}
+
+
+@pytest.fixture
+def dead_letters():
+    import teams_sender
+    records = []
+    teams_sender.set_dead_letter_handler(records.append)
+    yield records
+    teams_sender.set_dead_letter_handler(None)
+
+
+def token_requests(server):
+    return server.route_calls.get("/token", 0)
+
+
+def teams_posts(server):
+    return sum(path.startswith("/conversations/") for path, _ in server.posts)
+
+
+def test_rejected_token_is_renewed_once(server, creds, dead_letters):
+    import teams_sender
+    before_posts = teams_posts(server)
+    before_tokens = token_requests(server)
+    server.routes["/conversations/"] = (401, {"error": "token expired"})
+    try:
+        response = teams_sender.post_activity(creds, "conversation-401", {"type": "message", "text": "hi"})
+    finally:
+        server.routes["/conversations/"] = (201, {"id": "activity-id"})
+    assert response.status_code == 401
+    assert teams_posts(server) - before_posts == 2
+    assert token_requests(server) - before_tokens == 2
+    assert [record["reason"] for record in dead_letters] == ["status 401"]
+
+    # The renewed token is cached again once the connector accepts it
+    assert teams_sender.post_activity(creds, "conversation-401", {"type": "message", "text": "hi"}).status_code == 201
+    assert token_requests(server) - before_tokens == 3
+    teams_sender.post_activity(creds, "conversation-401", {"type": "message", "text": "hi"})
+    assert token_requests(server) - before_tokens == 3
+
+
+def test_rotated_secret_gets_its_own_token(server, creds):
+    import token_helper
+    before = token_requests(server)
+    token_helper.get_auth_token(creds)
+    token_helper.get_auth_token(creds)
+    token_helper.get_auth_token(dict(creds, teams_client_secret="rotated"))
+    assert token_requests(server) - before == 2
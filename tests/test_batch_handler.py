@@ -0,0 +1,58 @@
+"""
+An SQS batch looks each client and conversation up once, also when it is unknown or runs the async pipeline
+"""
+import pytest
+from benchmarks.stubs import sqs_record, synthetic_event
+
+
+def run_batch(auth_id, client_id="bench", pipeline_mode="sync", records=3):
+    import batch_handler
+    events = []
+    for index in range(records):
+        event = synthetic_event("message", auth_id, index)
+        event["client_id"] = client_id
+        event["pipeline_mode"] = pipeline_mode
+        events.append(sqs_record(event, f"{auth_id}-{index}"))
+    return batch_handler.sqs_handler({"Records": events}, None)
+
+
+@pytest.fixture
+def conversation_lookups(monkeypatch):
+    import lambda_function
+    lookups = []
+    get_conversation_id = lambda_function.get_conversation_id
+
+    def counting_lookup(auth_id, *args):
+        lookups.append(auth_id)
+        return get_conversation_id(auth_id, *args)
+
+    monkeypatch.setattr(lambda_function, "get_conversation_id", counting_lookup)
+    return lookups
+
+
+def test_unknown_client_is_read_once(stand_ins, conversation, conversation_lookups):
+    table = stand_ins["client_mapping_table"]
+    before = table.calls.get("get_item", 0)
+    assert run_batch(conversation, client_id="unknown-client") == {"batchItemFailures": []}
+    assert table.calls.get("get_item", 0) - before == 1
+    assert conversation_lookups == []
+
+
+def test_unknown_user_is_looked_up_once(stand_ins, server, conversation_lookups):
+    posts = len(server.posts)
+    assert run_batch("user-without-conversation") == {"batchItemFailures": []}
+    assert conversation_lookups == ["user-without-conversation"]
+    assert len(server.posts) == posts
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_lookups_are_passed_to_the_pipeline(stand_ins, server, conversation, conversation_lookups, pipeline_mode):
+    import db_helper
+    db_helper.invalidate_client_config("bench")
+    table = stand_ins["client_mapping_table"]
+    before = table.calls.get("get_item", 0)
+    assert run_batch(conversation, pipeline_mode=pipeline_mode) == {"batchItemFailures": []}
+    assert conversation_lookups == [conversation]
+    assert table.calls.get("get_item", 0) - before == 1
+    con_id = stand_ins["teams_reverse_mapping"].items[(conversation,)]["con_id"]
+    assert len([path for path, _ in server.posts if path.startswith(f"/conversations/{con_id}/")]) == 3
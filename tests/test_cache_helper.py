@@ -0,0 +1,26 @@
+"""
+The bounded TTL cache the helpers keep their warm-container entries in
+"""
+import time
+from cache_helper import TTLCache
+
+
+def test_entries_expire_and_the_least_recent_is_evicted():
+    cache = TTLCache(2, ttl=0.2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None and len(cache) == 2
+    time.sleep(0.25)
+    assert cache.get("a") is None
+    assert cache.get("c", max_age=1) == 3
+
+
+def test_pop_keeps_a_replaced_value():
+    cache = TTLCache(4)
+    cache.put("token", "new")
+    cache.pop("token", only_if=lambda value: value == "old")
+    assert cache.get("token") == "new"
+    cache.pop("token", only_if=lambda value: value == "new")
+    assert cache.get("token") is None
@@ -0,0 +1,75 @@
+"""
+Cards over the Teams button limit are trimmed and still delivered, and only sent activities reach the transcript
+"""
+import json
+import pytest
+from benchmarks.stubs import synthetic_event
+
+
+def bot_break_event(auth_id, intents):
+    return {"client_id": "bench", "itsm": "bench-itsm", "user": auth_id, "body": {
+        "event_name": "message",
+        "message": {"body": {"type": "TEXT", "text": "BOT BREAK", "data": {"intents": intents}}}}}
+
+
+def button_event(auth_id, buttons):
+    return {"client_id": "bench", "itsm": "bench-itsm", "user": auth_id, "body": {
+        "event_name": "message",
+        "message": {"body": {"type": "BUTTON", "text": "Pick one", "data": {"items": [
+            {"type": "TEXT_ONLY", "actionable_text": f"Option {index}", "payload": {"message": f"option {index}"}}
+            for index in range(buttons)]}}}}}
+
+
+def run_event(event, pipeline_mode):
+    import lambda_function
+    event["pipeline_mode"] = pipeline_mode
+    lambda_function.lambda_handler(event, None)
+
+
+def posted_buttons(server, stand_ins, auth_id):
+    conversation_id = stand_ins["teams_reverse_mapping"].items[(auth_id,)]["con_id"]
+    return [[button["title"] for button in json.loads(body)["attachments"][0]["content"]["buttons"]]
+            for path, body in server.posts if path.startswith(f"/conversations/{conversation_id}/")]
+
+
+def transcript_lines(stand_ins, auth_id):
+    conversation_id = stand_ins["teams_reverse_mapping"].items[(auth_id,)]["con_id"]
+    return [key for key in stand_ins["chat_transcript_table"].items if key[0] == conversation_id]
+
+
+@pytest.fixture
+def dead_letters():
+    import teams_sender
+    records = []
+    teams_sender.set_dead_letter_handler(records.append)
+    yield records
+    teams_sender.set_dead_letter_handler(None)
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_kendra_card_keeps_talk_to_an_agent_within_the_limit(stand_ins, server, conversation, dead_letters,
+                                                             pipeline_mode):
+    run_event(bot_break_event(conversation, ["VPN", "Email", "Printer", "Wi-Fi"]), pipeline_mode)
+    cards = posted_buttons(server, stand_ins, conversation)
+    assert len(cards) == 1 and len(cards[0]) == 6
+    assert "Talk to an Agent 💬" in cards[0]
+    assert dead_letters == []
+    assert len(transcript_lines(stand_ins, conversation)) == 1
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_button_message_over_the_limit_is_trimmed(stand_ins, server, conversation, dead_letters, pipeline_mode):
+    run_event(button_event(conversation, 9), pipeline_mode)
+    assert posted_buttons(server, stand_ins, conversation) == [[f"Option {index} 💬" for index in range(6)]]
+    assert dead_letters == []
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_rejected_activity_is_not_stored(stand_ins, server, conversation, dead_letters, pipeline_mode):
+    server.routes["/conversations/"] = (400, {"error": "bad activity"})
+    try:
+        run_event(synthetic_event("message", conversation), pipeline_mode)
+    finally:
+        server.routes["/conversations/"] = (201, {"id": "activity-id"})
+    assert len(dead_letters) == 1
+    assert transcript_lines(stand_ins, conversation) == []
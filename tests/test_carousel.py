@@ -0,0 +1,102 @@
+"""
+CAROUSEL messages post their images to Teams in order while the TICKET_ATTACHMENT invokes run in the background,
+and InvokeBatcher.flush waits for every invoke of the event
+"""
+import json
+import time
+import pytest
+from benchmarks.stubs import FakeLambdaClient
+
+
+def carousel_event(auth_id, images):
+    return {"client_id": "bench", "itsm": "bench-itsm", "user": auth_id, "body": {
+        "event_name": "message",
+        "message": {"body": {"type": "CAROUSEL", "text": "", "data": {"items": [
+            {"title": f"Step {step}", "thumbnail": {"image": f"https://img.example.com/{step}.png"}}
+            for step in range(images)]}}}}}
+
+
+def run_event(event, pipeline_mode="sync"):
+    import lambda_function
+    event["pipeline_mode"] = pipeline_mode
+    lambda_function.lambda_handler(event, None)
+
+
+def attachment_invokes(stand_ins, auth_id):
+    return [payload["payload"] for _, invocation_type, payload in stand_ins["lambda"].invocations
+            if invocation_type == "Event" and payload["payload"].get("auth_id") == auth_id
+            and payload["payload"].get("event") == "TICKET_ATTACHMENT"]
+
+
+@pytest.fixture
+def lambda_latency(stand_ins):
+    """
+    Sets the latency of the fake Lambda client for the test
+    """
+    def set_latency(seconds):
+        stand_ins["lambda"].latency = seconds
+    yield set_latency
+    stand_ins["lambda"].latency = 0.0
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_images_are_posted_in_carousel_order(stand_ins, server, conversation, pipeline_mode):
+    conversation_id = stand_ins["teams_reverse_mapping"].items[(conversation,)]["con_id"]
+    run_event(carousel_event(conversation, 6), pipeline_mode)
+    posted = [json.loads(body)["attachments"][0]["contentUrl"] for path, body in server.posts
+              if path.startswith(f"/conversations/{conversation_id}/")]
+    assert posted == [f"https://img.example.com/{step}.png" for step in range(6)]
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_every_attachment_invoke_is_issued(stand_ins, conversation, pipeline_mode):
+    run_event(carousel_event(conversation, 4), pipeline_mode)
+    invokes = attachment_invokes(stand_ins, conversation)
+    assert sorted(invoke["file_link"] for invoke in invokes) == [f"https://img.example.com/{step}.png"
+                                                                  for step in range(4)]
+    assert all(invoke["file_type"] == "png" for invoke in invokes)
+
+
+def test_attachment_invokes_overlap(stand_ins, conversation, lambda_latency):
+    lambda_latency(0.2)
+    start = time.perf_counter()
+    run_event(carousel_event(conversation, 3))
+    elapsed = time.perf_counter() - start
+    # One after another the invokes alone would take 0.6s
+    assert len(attachment_invokes(stand_ins, conversation)) == 3
+    assert elapsed < 0.45
+
+
+def test_flush_waits_for_every_invoke(stand_ins, lambda_latency):
+    from invoke_helper import batched_invokes, invoke_async
+    lambda_latency(0.1)
+    before = len(stand_ins["lambda"].invocations)
+    with batched_invokes():
+        for index in range(3):
+            invoke_async("bench-ticketing", {"index": index})
+    assert len(stand_ins["lambda"].invocations) - before == 3
+
+
+class FailingLambdaClient(FakeLambdaClient):
+    """
+    Fails the invokes whose payload has "fail" set
+    """
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        if json.loads(Payload).get("fail"):
+            raise RuntimeError("Injected failure")
+        return super().invoke(FunctionName, InvocationType, Payload)
+
+
+def test_flush_survives_a_failed_invoke(stand_ins):
+    import invoke_helper
+    failing = FailingLambdaClient(latency=0.05)
+    invoke_helper.lambda_client.set_factory(lambda: failing)
+    try:
+        with invoke_helper.batched_invokes():
+            invoke_helper.invoke_async("bench-ticketing", {"index": 0})
+            invoke_helper.invoke_async("bench-ticketing", {"index": 1, "fail": True})
+            invoke_helper.invoke_async("bench-ticketing", {"index": 2})
+    finally:
+        invoke_helper.lambda_client.set_factory(lambda: stand_ins["lambda"])
+    assert sorted(payload["index"] for _, _, payload in failing.invocations) == [0, 2]
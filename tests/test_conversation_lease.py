@@ -0,0 +1,36 @@
+"""
+The lease of a running event is renewed past conversation_lease_ttl and stays with it until the event ends
+"""
+import time
+import pytest
+
+
+@pytest.fixture
+def short_lease(monkeypatch):
+    import sequence_helper
+    monkeypatch.setattr(sequence_helper, "CONVERSATION_SEQUENCING", True)
+    monkeypatch.setattr(sequence_helper, "CONVERSATION_LEASE_TTL", 1)
+    monkeypatch.setattr(sequence_helper, "CONVERSATION_LEASE_RENEW", 0.2)
+    monkeypatch.setattr(sequence_helper, "CONVERSATION_LEASE_WAIT", 0.3)
+    return sequence_helper
+
+
+def test_running_event_keeps_its_lease(stand_ins, short_lease):
+    with short_lease.conversation_lease("conversation-long-event", "event-1") as lease:
+        # Longer than the lease's TTL, as several sends to a slow connector can be
+        time.sleep(2.5)
+        with pytest.raises(short_lease.ConversationBusyError):
+            short_lease.acquire("conversation-long-event", "event-2")
+        assert not lease.lost
+    with short_lease.conversation_lease("conversation-long-event", "event-1") as redelivered:
+        assert redelivered.duplicate
+
+
+def test_lease_taken_over_is_not_released(stand_ins, short_lease):
+    with short_lease.conversation_lease("conversation-taken-over", "event-1") as lease:
+        item = stand_ins["teams_mapping_table"].items[(short_lease.lease_key("conversation-taken-over"),)]
+        item["lock_owner"] = "another-event"
+        time.sleep(0.5)
+        assert lease.lost
+    assert item["lock_owner"] == "another-event"
+    assert item.get("lock_expires") != 0
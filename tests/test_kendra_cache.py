@@ -0,0 +1,45 @@
+"""
+An index invalidated by another container stops being served from this container's cache within kendra_marker_ttl
+"""
+import time
+import pytest
+from benchmarks.stubs import FakeTable
+
+
+@pytest.fixture
+def shared_tier(stand_ins, monkeypatch):
+    import aws_helper
+    import kendra_helper
+    table = FakeTable(["cache_key"], name="kendra_cache_table")
+    monkeypatch.setenv("kendra_cache_table", "kendra_cache_table")
+    monkeypatch.setenv("index_id", "index-shared")
+    aws_helper.table("kendra_cache_table").set_factory(lambda: table)
+    monkeypatch.setattr(kendra_helper._index_markers, "ttl", 0.2)
+    kendra_helper._result_cache.clear()
+    kendra_helper._index_markers.clear()
+    yield table
+    kendra_helper._result_cache.clear()
+    kendra_helper._index_markers.clear()
+
+
+def test_invalidation_elsewhere_reaches_the_local_cache(stand_ins, shared_tier):
+    import kendra_helper
+    kendra = stand_ins["kendra"]
+    before = kendra.calls
+    kendra_helper.search_kendra("VPN not working?")
+    kendra_helper.search_kendra("vpn not working")
+    assert kendra.calls - before == 1
+
+    # Another container invalidates the index: only the shared marker changes, not this container's cache
+    time.sleep(0.01)
+    invalidated_at = int(time.time() * 1000)
+    shared_tier.put_item(Item={"cache_key": kendra_helper._index_marker_key("index-shared"),
+                               "invalidated_at": invalidated_at, "expires_at": invalidated_at // 1000 + 60})
+    time.sleep(0.25)
+    kendra_helper.search_kendra("vpn not working")
+    assert kendra.calls - before == 2
+    # The new result is served locally again, with the marker read at most once per kendra_marker_ttl
+    reads = shared_tier.calls.get("get_item", 0)
+    kendra_helper.search_kendra("vpn not working")
+    assert kendra.calls - before == 2
+    assert shared_tier.calls.get("get_item", 0) - reads <= 1
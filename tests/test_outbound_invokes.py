@@ -0,0 +1,89 @@
+"""
+Counts the Lambda invokes each event type makes: RequestResponse invokes go to the translation service,
+Event invokes to the ticketing handler
+"""
+import pytest
+from benchmarks.stubs import synthetic_event
+
+
+def kendra_event(auth_id):
+    return {"client_id": "bench", "itsm": "bench-itsm", "user": auth_id, "body": {
+        "event_name": "message",
+        "message": {"body": {"type": "TEXT", "text": "BOT BREAK", "data": {"intents": ["Reset password"]}}}}}
+
+
+def build_event(event_type, auth_id):
+    return kendra_event(auth_id) if event_type == "kendra" else synthetic_event(event_type, auth_id)
+
+
+def count_invokes(stand_ins, event, pipeline_mode):
+    import lambda_function
+    event["pipeline_mode"] = pipeline_mode
+    before = dict(stand_ins["lambda"].calls)
+    lambda_function.lambda_handler(event, None)
+    after = stand_ins["lambda"].calls
+    return {invocation_type: after.get(invocation_type, 0) - before.get(invocation_type, 0)
+            for invocation_type in ("RequestResponse", "Event")}
+
+
+# (translation invokes with translation on, ticketing invokes) per event type
+EXPECTED_INVOKES = {
+    "pinned": (1, 0),
+    "message": (1, 0),
+    "button": (1, 1),
+    "carousel": (0, 3),
+    "kendra": (1, 0),
+    "conversation_complete": (1, 1),
+}
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+@pytest.mark.parametrize("event_type", sorted(EXPECTED_INVOKES))
+@pytest.mark.parametrize("translation", [True, False], indirect=True)
+def test_invokes_per_event_type(stand_ins, conversation, translation, event_type, pipeline_mode):
+    translations, tickets = EXPECTED_INVOKES[event_type]
+    invokes = count_invokes(stand_ins, build_event(event_type, conversation), pipeline_mode)
+    assert invokes == {"RequestResponse": translations if translation else 0, "Event": tickets}
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+@pytest.mark.parametrize("translation", [True], indirect=True)
+def test_repeated_system_message_is_translated_once(stand_ins, conversation, translation, pipeline_mode):
+    count_invokes(stand_ins, synthetic_event("pinned", conversation), pipeline_mode)
+    invokes = count_invokes(stand_ins, synthetic_event("pinned", conversation), pipeline_mode)
+    assert invokes == {"RequestResponse": 0, "Event": 0}
+
+
+@pytest.mark.parametrize("event_type", ["pinned", "message", "kendra"])
+@pytest.mark.parametrize("translation", [True], indirect=True)
+def test_no_translation_when_user_reads_the_source_language(stand_ins, conversation, translation, event_type):
+    import translation_helper
+    translation_helper.remember_language(conversation, translation_helper.DEFAULT_SOURCE_LANGUAGE)
+    invokes = count_invokes(stand_ins, build_event(event_type, conversation), "sync")
+    assert invokes["RequestResponse"] == 0
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+@pytest.mark.parametrize("translation", [True], indirect=True)
+def test_user_language_from_the_mapping(stand_ins, conversation, translation, pipeline_mode):
+    import translation_helper
+    con_id = stand_ins["teams_reverse_mapping"].items[(conversation,)]["con_id"]
+    mapping = stand_ins["teams_mapping_table"].items[(con_id,)]
+    mapping["user_language"] = translation_helper.DEFAULT_SOURCE_LANGUAGE
+    assert count_invokes(stand_ins, synthetic_event("pinned", conversation), pipeline_mode)["RequestResponse"] == 0
+
+    # The user switches language: the next event reads it and its translations are cached per language
+    mapping["user_language"] = "fr"
+    assert count_invokes(stand_ins, synthetic_event("pinned", conversation), pipeline_mode)["RequestResponse"] == 1
+    assert translation_helper.resolve_language(conversation) == "fr"
+
+
+@pytest.mark.parametrize("translation", [True], indirect=True)
+def test_per_user_translations_expire(stand_ins, conversation, translation, monkeypatch):
+    import time
+    import translation_helper
+    monkeypatch.setattr(translation_helper, "USER_LANGUAGE_TTL", 0.2)
+    count_invokes(stand_ins, synthetic_event("pinned", conversation), "sync")
+    assert count_invokes(stand_ins, synthetic_event("pinned", conversation), "sync")["RequestResponse"] == 0
+    time.sleep(0.25)
+    assert count_invokes(stand_ins, synthetic_event("pinned", conversation), "sync")["RequestResponse"] == 1
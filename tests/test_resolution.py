@@ -0,0 +1,45 @@
+"""
+A conversation_complete event whose Haptik fetch fails still sends its ticket and completes once
+"""
+from types import SimpleNamespace
+import pytest
+import requests
+from benchmarks.stubs import synthetic_event
+
+
+def failing_fetch(*args):
+    raise requests.ReadTimeout("Injected read timeout")
+
+
+def patch_fetch(monkeypatch, pipeline_mode):
+    import async_pipeline
+    import lambda_function
+
+    async def failing_fetch_async(*args):
+        failing_fetch(*args)
+
+    if pipeline_mode == "sync":
+        monkeypatch.setattr(lambda_function, "get_chat_transcripts", failing_fetch)
+    else:
+        monkeypatch.setattr(async_pipeline, "get_chat_transcripts_async", failing_fetch_async)
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_failed_fetch_sends_the_ticket_once(stand_ins, server, conversation, monkeypatch, pipeline_mode):
+    import lambda_function
+    patch_fetch(monkeypatch, pipeline_mode)
+    conversation_id = stand_ins["teams_reverse_mapping"].items[(conversation,)]["con_id"]
+    context = SimpleNamespace(aws_request_id=f"request-{conversation}")
+    # Lambda and SQS retries deliver the event again under the same request id
+    for _ in range(3):
+        event = synthetic_event("conversation_complete", conversation)
+        event["pipeline_mode"] = pipeline_mode
+        lambda_function.lambda_handler(event, context)
+
+    posts = [path for path, _ in server.posts if path.startswith(f"/conversations/{conversation_id}/")]
+    lines = [key for key in stand_ins["chat_transcript_table"].items if key[0] == conversation_id]
+    tickets = [payload["payload"] for _, invocation_type, payload in stand_ins["lambda"].invocations
+               if invocation_type == "Event" and payload.get("payload", {}).get("conversation_id") == conversation_id]
+    assert len(posts) == 1
+    assert len(lines) == 1
+    assert [(ticket["event"], ticket["chat_history"]) for ticket in tickets] == [("TICKET_RESOLUTION", None)]
@@ -0,0 +1,48 @@
+"""
+Sends to an unreachable connector are retried by the sender alone, within teams_send_timeout
+"""
+import socket
+import time
+import pytest
+
+
+@pytest.fixture
+def unreachable_url():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def dead_letters():
+    import teams_sender
+    records = []
+    teams_sender.set_dead_letter_handler(records.append)
+    yield records
+    teams_sender.set_dead_letter_handler(None)
+
+
+def test_connect_errors_are_only_retried_by_the_sender(unreachable_url, dead_letters, monkeypatch):
+    import http_helper
+    import teams_sender
+    import token_helper
+    monkeypatch.setattr(teams_sender, "TEAMS_SEND_TIMEOUT", 1.0)
+    monkeypatch.setattr(token_helper, "get_auth_token", lambda creds: "Bearer stub-token")
+    monkeypatch.setattr(teams_sender, "get_auth_token", lambda creds: "Bearer stub-token")
+    attempts = []
+    request = http_helper.request
+
+    def counting_request(method, url, retry=True, **kwargs):
+        attempts.append(retry)
+        return request(method, url, retry, **kwargs)
+
+    monkeypatch.setattr(http_helper, "request", counting_request)
+    creds = {"teams_base_url": unreachable_url, "teams_client_id": "unreachable"}
+    start = time.monotonic()
+    assert teams_sender.post_activity(creds, "conversation-unreachable", {"type": "message", "text": "hi"}) is None
+    assert time.monotonic() - start < 1.0
+    # One attempt, then a retry after the first backoff; the next backoff would pass the deadline
+    assert attempts == [False, False]
+    assert http_helper.get_session(unreachable_url, retry=False).get_adapter(unreachable_url).max_retries.total == 0
+    assert len(dead_letters) == 1 and dead_letters[0]["reason"].startswith("ConnectionError")
@@ -0,0 +1,20 @@
+"""
+Each event is reported as one EMF record, with its total time and the calls of every dependency
+"""
+import json
+from benchmarks.stubs import synthetic_event
+
+
+def test_one_record_per_event(stand_ins, server, conversation, monkeypatch, capsys):
+    import lambda_function
+    import tracing
+    monkeypatch.setattr(tracing, "TRACE_METRICS", True)
+    capsys.readouterr()
+    lambda_function.lambda_handler(synthetic_event("message", conversation), None)
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines() if '"_aws"' in line]
+    assert len(records) == 1
+    record = records[0]
+    assert record["teams_calls"] >= 1 and record["kendra_calls"] == 0
+    assert record["total_ms"] >= sum(record["teams_latency_ms"])
+    names = {metric["Name"] for metric in record["_aws"]["CloudWatchMetrics"][0]["Metrics"]}
+    assert {name for name in record if name.endswith(("_ms", "_calls", "_retries", "_errors"))} == names
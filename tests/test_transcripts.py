@@ -0,0 +1,44 @@
+"""
+Messages of unknown conversations are not stored, and a legacy transcript is only removed once all of it is copied
+"""
+import pytest
+from benchmarks.stubs import synthetic_event
+
+
+def transcript_lines(stand_ins, con_id):
+    return [item["line"] for key, item in sorted(stand_ins["chat_transcript_table"].items.items())
+            if key[0] == con_id]
+
+
+@pytest.mark.parametrize("pipeline_mode", ["sync", "async"])
+def test_message_of_an_unmapped_conversation_is_not_stored(stand_ins, server, conversation, pipeline_mode):
+    import lambda_function
+    con_id = stand_ins["teams_reverse_mapping"].items[(conversation,)]["con_id"]
+    del stand_ins["teams_mapping_table"].items[(con_id,)]
+    event = synthetic_event("message", conversation)
+    event["pipeline_mode"] = pipeline_mode
+    lambda_function.lambda_handler(event, None)
+    assert transcript_lines(stand_ins, con_id) == []
+
+
+def test_migration_starts_over_when_the_transcript_changes(stand_ins, conversation, monkeypatch):
+    import transcript_helper
+    con_id = stand_ins["teams_reverse_mapping"].items[(conversation,)]["con_id"]
+    mapping = stand_ins["teams_mapping_table"].items[(con_id,)]
+    mapping["chat_transcript"] = "line 1\nline 2"
+    read = transcript_helper._read_legacy_transcript
+    reads = []
+
+    def read_then_append(con_id):
+        chat_transcript = read(con_id)
+        reads.append(chat_transcript)
+        if len(reads) == 1:
+            # A container still running the legacy code appends while the first copy is written
+            mapping["chat_transcript"] += "\nline 3"
+        return chat_transcript
+
+    monkeypatch.setattr(transcript_helper, "_read_legacy_transcript", read_then_append)
+    assert transcript_helper.migrate_legacy_transcript(con_id) == 3
+    assert "chat_transcript" not in mapping
+    assert transcript_lines(stand_ins, con_id) == ["line 1", "line 2", "line 3"]
+    assert transcript_helper.read_transcript(con_id) == "line 1\nline 2\nline 3"
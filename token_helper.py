@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import http_helper
+from cache_helper import SharedTier, TTLCache
+from log_helper import Payload
+from tracing import span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Tokens are refreshed this many seconds before expires_in runs out
+REFRESH_MARGIN = int(os.environ.get("auth_token_refresh_margin", "300"))
+DEFAULT_EXPIRES_IN = 3599
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get("auth_token_cache_size", "256"))
+
+# Tokens carry their own expiry, so the cache only bounds how many are kept
+_token_cache = TTLCache(AUTH_TOKEN_CACHE_SIZE)
+_shared_tokens = SharedTier("auth_token_table", "auth token", key_name="token_key")
+_refresh_locks = {}
+_refresh_locks_lock = threading.Lock()
+
+
+def get_auth_token(creds):
+    """
+    Returns a Bearer token for the given creds, reusing a cached token while it is still fresh.
+    Only one caller per creds refreshes at a time; the rest wait and reuse its result.
+    """
+    key = _cache_key(creds)
+    token = _get_cached_token(key)
+    if token:
+        return token
+    with _get_refresh_lock(key):
+        # Another caller may have refreshed the token while we were waiting on the lock
+        token = _get_cached_token(key)
+        if token:
+            return token
+        token, expires_at = get_shared_token(key)
+        if not token:
+            access_token, expires_in = request_auth_token(creds)
+            if not access_token:
+                return None
+            token = "Bearer " + access_token
+            expires_at = time.time() + expires_in
+            put_shared_token(key, token, expires_at)
+        _token_cache.put(key, (token, expires_at))
+        return token
+
+
+def request_auth_token(creds):
+    """
+    Generates a new auth token from the identity endpoint. Returns the access_token and its expires_in
+    """
+    url = os.environ.get('auth_token_url')
+
+    payload = {
+        "grant_type": "client_credentials",
+        "client_id": creds["teams_client_id"],
+        "client_secret": creds["teams_client_secret"],
+        "scope": creds["teams_scope"]
+    }
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+    with span("teams", "auth_token") as sp:
+        response = http_helper.request("POST", url, headers=headers, data=payload)
+        sp.record_response(response)
+    if response.status_code == 200:
+        body = response.json()
+        return body.get("access_token"), int(body.get("expires_in", DEFAULT_EXPIRES_IN))
+    logger.error("couldn't generate auth token:\n%s", Payload(response.text))
+    return None, 0
+
+
+def invalidate_auth_token(creds, token):
+    """
+    Drops a token the connector rejected from this container and the shared tier, unless another caller
+    already replaced it, so the next get_auth_token requests a new one
+    """
+    key = _cache_key(creds)
+    _token_cache.pop(key, only_if=lambda cached: cached[0] == token)
+    _shared_tokens.delete(_shared_key(key), ConditionExpression="access_token = :token",
+                          ExpressionAttributeValues={":token": token})
+
+
+def clear_token_cache():
+    """
+    Drops every token cached in this container
+    """
+    _token_cache.clear()
+
+
+def get_shared_token(key):
+    """
+    Reads a still-fresh token from the shared DynamoDB tier, if one is configured
+    """
+    item = _shared_tokens.get(_shared_key(key)) or {}
+    expires_at = float(item.get("expires_at", 0))
+    if item.get("access_token") and _is_fresh(expires_at):
+        return item["access_token"], expires_at
+    return None, 0
+
+
+def put_shared_token(key, token, expires_at):
+    """
+    Stores the token in the shared DynamoDB tier so cold containers can skip the identity round trip
+    """
+    _shared_tokens.put(_shared_key(key), {"access_token": token, "expires_at": int(expires_at)})
+
+
+def _get_cached_token(key):
+    token, expires_at = _token_cache.get(key) or (None, 0)
+    if token and _is_fresh(expires_at):
+        return token
+    return None
+
+
+def _get_refresh_lock(key):
+    with _refresh_locks_lock:
+        return _refresh_locks.setdefault(key, threading.Lock())
+
+
+def _is_fresh(expires_at):
+    return time.time() < expires_at - REFRESH_MARGIN
+
+
+def _cache_key(creds):
+    # The secret's digest is part of the key, so a rotated secret does not keep being served the old token
+    secret_digest = hashlib.sha256(str(creds["teams_client_secret"]).encode()).hexdigest()[:16]
+    return creds["teams_client_id"], creds["teams_scope"], secret_digest
+
+
+def _shared_key(key):
+    return "|".join(key)
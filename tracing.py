@@ -0,0 +1,183 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+import http_helper
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TRACE_METRICS = os.environ.get("trace_metrics", "true").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("metrics_namespace", "TeamsOutboundHandler")
+# Upper bounds in milliseconds of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# EMF accepts at most 100 values per metric
+MAX_EMF_VALUES = 100
+# Every known dependency is reported, so untouched dependencies show up as 0 calls instead of missing data
+DEPENDENCIES = ("dynamodb", "teams", "haptik", "kendra", "translation", "lambda")
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+class Trace:
+    """
+    The spans of one event, keyed by dependency, plus the trace id and client_id they are reported under
+    """
+    __slots__ = ("trace_id", "client_id", "records", "lock")
+
+    def __init__(self, trace_id, client_id):
+        self.trace_id = trace_id
+        self.client_id = client_id
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def add(self, dependency, duration_ms, retries, error):
+        with self.lock:
+            record = self.records.get(dependency)
+            if record is None:
+                record = self.records[dependency] = {"latency_ms": [], "retries": 0, "errors": 0}
+            record["latency_ms"].append(duration_ms)
+            record["retries"] += retries
+            record["errors"] += error
+
+
+class Span:
+    """
+    Times one outbound call. Exceptions count as errors; callers can also flag an error or record retries.
+    """
+    __slots__ = ("dependency", "operation", "start", "retries", "error")
+
+    def __init__(self, dependency, operation):
+        self.dependency = dependency
+        self.operation = operation
+        self.retries = 0
+        self.error = False
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        error = self.error or exc_type is not None
+        trace = _current_trace.get()
+        client_id = trace.client_id if trace else None
+        duration_ms = duration * 1000
+        if trace is not None:
+            trace.add(self.dependency, duration_ms, self.retries, error)
+        _observe(self.dependency, client_id, duration_ms, self.retries, error)
+        return False
+
+    def record_response(self, response):
+        """
+        Takes the retry count and error status from a requests.Response or an async_helper.AsyncResponse
+        """
+        retries = getattr(response, "retries", None)
+        self.retries += retries if isinstance(retries, int) else http_helper.retry_count(response)
+        if response.status_code >= 400:
+            self.error = True
+
+    def record_aws_response(self, response):
+        """
+        Takes the retry count botocore reports in the response metadata, and flags Lambda function errors
+        """
+        self.retries += response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+        if "FunctionError" in response:
+            self.error = True
+        return response
+
+
+def span(dependency, operation=""):
+    return Span(dependency, operation)
+
+
+class trace:
+    """
+    Starts a trace for one event; the event's time and the spans recorded inside it are emitted as one EMF
+    record when it exits
+    """
+
+    def __init__(self, client_id, trace_id=None):
+        self.trace = Trace(trace_id or uuid.uuid4().hex, client_id)
+
+    def __enter__(self):
+        self.token = _current_trace.set(self.trace)
+        self.start = time.perf_counter()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self.token)
+        if TRACE_METRICS:
+            emit_trace_metrics(self.trace, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def current_client_id():
+    trace = _current_trace.get()
+    return trace.client_id if trace else None
+
+
+def emit_trace_metrics(trace, duration_ms):
+    """
+    Prints the trace as one CloudWatch Embedded Metric Format record: the event's total time and, per dependency,
+    the latency of every call and the call, retry and error counts
+    """
+    with trace.lock:
+        records = {dependency: dict(record) for dependency, record in trace.records.items()}
+    for dependency in DEPENDENCIES:
+        records.setdefault(dependency, {"latency_ms": [], "retries": 0, "errors": 0})
+    metrics = [{"Name": "total_ms", "Unit": "Milliseconds"}]
+    record = {"ClientId": str(trace.client_id), "trace_id": trace.trace_id, "total_ms": round(duration_ms, 3)}
+    for dependency, values in records.items():
+        if values["latency_ms"]:
+            metrics.append({"Name": f"{dependency}_latency_ms", "Unit": "Milliseconds"})
+            record[f"{dependency}_latency_ms"] = [round(value, 3) for value in values["latency_ms"][:MAX_EMF_VALUES]]
+        for name in ("calls", "retries", "errors"):
+            metrics.append({"Name": f"{dependency}_{name}", "Unit": "Count"})
+        record[f"{dependency}_calls"] = len(values["latency_ms"])
+        record[f"{dependency}_retries"] = values["retries"]
+        record[f"{dependency}_errors"] = values["errors"]
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICS_NAMESPACE,
+                "Dimensions": [[], ["ClientId"]],
+                "Metrics": metrics
+            }]
+        },
+        **record
+    }))
+
+
+def get_histograms():
+    """
+    Returns the warm container's latency histograms, retry and error counts per (dependency, client_id).
+    Bucket i counts the calls up to LATENCY_BUCKETS_MS[i]; the last bucket counts the slower ones.
+    """
+    with _histograms_lock:
+        return {key: {"buckets": list(value["buckets"]), "retries": value["retries"], "errors": value["errors"]}
+                for key, value in _histograms.items()}
+
+
+def _observe(dependency, client_id, duration_ms, retries, error):
+    key = (dependency, client_id)
+    bucket = bisect_left(LATENCY_BUCKETS_MS, duration_ms)
+    with _histograms_lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "retries": 0, "errors": 0}
+        histogram["buckets"][bucket] += 1
+        histogram["retries"] += retries
+        histogram["errors"] += error
@@ -0,0 +1,159 @@
+import aws_helper
+import logging
+import sequence_helper
+import time
+import uuid
+from datetime import datetime
+from tracing import span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+# One item per message: con_id (partition key) + seq (sort key)
+transcript_table = aws_helper.table("chat_transcript_table")
+user_mapping_table = aws_helper.table("teams_mapping_table")
+
+LEGACY_SEQ_PREFIX = "0" * 20
+# Times a conversation's migration starts over when its chat_transcript changed while it was being copied
+MIGRATION_ATTEMPTS = 3
+
+
+def format_transcript_line(message, agent_name, sent_at=None):
+    formatted_time = (sent_at or datetime.now()).strftime("%H:%M:%S %d-%m-%Y")
+    return f"{formatted_time} [{agent_name}]: {message}"
+
+
+def next_sequence():
+    """
+    Returns a sort key that orders messages by the time they were stored.
+    The random suffix keeps two messages stored in the same nanosecond apart.
+    Under a conversation lease the key also follows every message stored by the conversation's earlier events.
+    """
+    lease = sequence_helper.current()
+    if lease is not None:
+        return lease.next_sequence()
+    return f"{time.time_ns():020d}#{uuid.uuid4().hex[:8]}"
+
+
+def build_transcript_item(message, con_id, agent_name):
+    return {
+        "con_id": con_id,
+        "seq": next_sequence(),
+        "agent_name": agent_name,
+        "line": format_transcript_line(message, agent_name)
+    }
+
+
+def append_message(message, con_id, agent_name):
+    """
+    Stores one chat message as its own item. The cost of the write does not depend on the conversation length.
+    """
+    item = build_transcript_item(message, con_id, agent_name)
+    with span("dynamodb", "append_message"):
+        transcript_table.put_item(Item=item, ConditionExpression="attribute_not_exists(seq)")
+    return item["seq"]
+
+
+def iter_transcript(con_id, include_legacy=True):
+    """
+    Yields the transcript lines of the conversation in order, one DynamoDB page at a time.
+    Lines of a concatenated transcript that has not been migrated yet come first. Its lines that a migration
+    in progress already copied are skipped.
+    """
+    migrating = False
+    if include_legacy:
+        for line in _iter_legacy_lines(con_id):
+            migrating = True
+            yield line
+    from boto3.dynamodb.conditions import Key
+    query = {
+        "KeyConditionExpression": Key("con_id").eq(con_id),
+        "ProjectionExpression": "seq, line" if migrating else "line"
+    }
+    while True:
+        response = transcript_table.query(**query)
+        for item in response.get("Items", []):
+            if migrating and item["seq"].startswith(LEGACY_SEQ_PREFIX):
+                continue
+            yield item.get("line", "")
+        if "LastEvaluatedKey" not in response:
+            break
+        query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def read_transcript(con_id):
+    """
+    Rebuilds the full chat transcript text of the conversation, e.g. for ticket resolution
+    """
+    return "\n".join(iter_transcript(con_id))
+
+
+def migrate_legacy_transcript(con_id):
+    """
+    Moves the concatenated chat_transcript of user_mapping_table into per-message items and removes it.
+    Legacy lines get sort keys that order them before every message stored by append_message.
+    The transcript is only removed while it is still the one that was copied; when a writer that still appends
+    to it got in between, the migration starts over. Returns the number of migrated lines.
+    """
+    from botocore.exceptions import ClientError
+    for attempt in range(MIGRATION_ATTEMPTS):
+        chat_transcript = _read_legacy_transcript(con_id)
+        if not chat_transcript:
+            return 0
+        lines = chat_transcript.split("\n")
+        # Copying the same lines again writes the same items, so a restarted migration cannot duplicate them
+        with transcript_table.batch_writer(overwrite_by_pkeys=["con_id", "seq"]) as batch:
+            for index, line in enumerate(lines):
+                batch.put_item(Item={
+                    "con_id": con_id,
+                    "seq": f"{LEGACY_SEQ_PREFIX}#{index:08d}",
+                    "line": line
+                })
+        try:
+            user_mapping_table.update_item(Key={"con_id": con_id},
+                                           UpdateExpression="remove chat_transcript",
+                                           ConditionExpression="chat_transcript = :read",
+                                           ExpressionAttributeValues={":read": chat_transcript})
+        except ClientError as ex:
+            if ex.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            logger.info(f"Transcript of conversation {con_id} changed while it was migrated, starting over")
+            continue
+        logger.info(f"Migrated {len(lines)} transcript lines for conversation: {con_id}")
+        return len(lines)
+    # The transcript stays in place and is migrated on the next run; readers skip the lines copied so far
+    logger.error(f"Transcript of conversation {con_id} kept changing, migration left for the next run")
+    return 0
+
+
+def migrate_all_transcripts():
+    """
+    Scans user_mapping_table and migrates every conversation that still has a concatenated chat_transcript
+    """
+    scan = {
+        "ProjectionExpression": "con_id",
+        "FilterExpression": "attribute_exists(chat_transcript)"
+    }
+    migrated = 0
+    while True:
+        response = user_mapping_table.scan(**scan)
+        for item in response.get("Items", []):
+            migrate_legacy_transcript(item["con_id"])
+            migrated += 1
+        if "LastEvaluatedKey" not in response:
+            break
+        scan["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return migrated
+
+
+def _iter_legacy_lines(con_id):
+    chat_transcript = _read_legacy_transcript(con_id)
+    if chat_transcript:
+        yield from chat_transcript.split("\n")
+
+
+def _read_legacy_transcript(con_id):
+    response = user_mapping_table.get_item(Key={"con_id": con_id},
+                                           ProjectionExpression="chat_transcript")
+    return response.get("Item", {}).get("chat_transcript")
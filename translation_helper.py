@@ -1,23 +1,298 @@
-import boto3
+import aws_helper
+import hashlib
 import json
 import logging
 import os
+import threading
+import time
+from cache_helper import SharedTier, TTLCache
+from log_helper import verbose
+from tracing import span
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-lambda_client = boto3.client("lambda")
+lambda_client = aws_helper.client("lambda")
+
+TRANSLATION_CACHE_SIZE = int(os.environ.get("translation_cache_size", "1024"))
+# Seconds a translation is kept in the shared DynamoDB tier
+TRANSLATION_CACHE_TTL = int(os.environ.get("translation_cache_ttl", "604800"))
+# Set once translation_service_arn accepts {"messages": [...]}; until then only a card's text is translated,
+# as the single-message service would fail the batch and be called again for every button title
+TRANSLATION_BATCH_ENABLED = os.environ.get("translation_batch_enabled", "false").lower() == "true"
+# Language the agents and the bot write in, unless the client's config sets source_language
+DEFAULT_SOURCE_LANGUAGE = os.environ.get("default_source_language", "en")
+# Seconds a user's language is kept before it is read again, and translations cached for a user whose language
+# is unknown are kept, so a user who changes language gets new translations
+USER_LANGUAGE_TTL = int(os.environ.get("user_language_ttl", "3600"))
+USER_LANGUAGE_CACHE_SIZE = int(os.environ.get("user_language_cache_size", "4096"))
+# Translations are cached under the user instead of a language while the user's language is unknown
+USER_KEY_PREFIX = "user:"
+
+# Fixed strings sent on every event of their kind, loaded from the shared tier when a language is first seen
+SYSTEM_MESSAGES = (
+    "----- *This conversation is marked as completed* -----",
+    "You can click the below button to download the file.",
+)
+
+_translation_cache = TTLCache(TRANSLATION_CACHE_SIZE)
+_shared_translations = SharedTier("translation_cache_table", "translation")
+_user_languages = TTLCache(USER_LANGUAGE_CACHE_SIZE, USER_LANGUAGE_TTL)
+_prewarmed_languages = set()
+_cache_lock = threading.Lock()
+
+
+class TranslationContext:
+    """
+    The translation decision of one invocation, made once from the client config and the user's language.
+    Handlers translate through it; it does not call the translation service when translation is off for the
+    client or the user is known to read the language the message is written in.
+    """
+
+    def __init__(self, enabled, user_id, source_language=DEFAULT_SOURCE_LANGUAGE, conversation_id=None):
+        self.enabled = enabled
+        self.user_id = user_id
+        self.source_language = source_language
+        self.conversation_id = conversation_id
+        self._language_loaded = conversation_id is None
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        # The user's language is checked on every call, as the first translation of the invocation may report it
+        if not self.enabled:
+            return False
+        self.load_language()
+        return known_language(self.user_id) != self.source_language
+
+    def load_language(self):
+        """
+        Takes the user's language from the user_language of the conversation's mapping, read once per invocation
+        """
+        with self.lock:
+            if self._language_loaded:
+                return
+            self._language_loaded = True
+        from conversation_helper import get_user_mapping
+        language = get_user_mapping(self.conversation_id).get("user_language")
+        if language:
+            remember_language(self.user_id, language)
+
+    def translate(self, message):
+        if not message or not self.active:
+            return message
+        logger.info("is_translation is True. Translation function is called")
+        translated = handle_message_translation(message, self.user_id)
+        return message if translated is None else translated
+
+    def translate_card(self, message, item_list):
+        if not self.active:
+            return message
+        logger.info("is_translation is True. Translation function is called")
+        return translate_card(message, item_list, self.user_id)
+
+
+def translation_context(client_config, user_id, conversation_id=None):
+    """
+    Builds the TranslationContext of an invocation for the client's config and the user. With a conversation_id,
+    the user's language is read from the conversation's mapping when translation is first needed.
+    """
+    if client_config is None:
+        return TranslationContext(False, user_id)
+    return TranslationContext(client_config.is_translation, user_id,
+                              client_config.item.get("source_language", DEFAULT_SOURCE_LANGUAGE), conversation_id)
 
 
 def handle_message_translation(message, user_id):
+    """
+    Translates the message for the user, serving repeated strings from the translation cache
+    """
+    language = resolve_language(user_id)
+    key = (normalize_text(message), language)
+    translated = _lookup_translation(key)
+    if translated is not None:
+        return translated
+
     payload = {
         "message": message,
         "user_id": user_id,
         "source": "agent"
     }
-    response = lambda_client.invoke(FunctionName=os.environ.get("translation_service_arn"),
-                                    InvocationType="RequestResponse",
-                                    Payload=json.dumps(payload))
-    response = json.load(response.get("Payload"))
-    logger.debug(f"Response of translation service is: {response}")
-        return response.get("translated_message")
\ No newline at end of file
+    response = _invoke_translation_service(payload)
+    translated = response.get("translated_message")
+    if translated is None:
+        return translated
+    language = _learn_language(user_id, response, language)
+    _store_translation((key[0], language), translated)
+    return translated
+
+
+def handle_batch_translation(messages, user_id):
+    """
+    Translates a list of strings for the user with at most one translation service call.
+    Strings are deduplicated and served from the translation cache when possible; the result keeps the input order.
+    The normalized text is only the cache key, the service is sent the strings as they were written.
+    """
+    language = resolve_language(user_id)
+    translations = {}
+    missing = {}
+    for message in messages:
+        text = normalize_text(message)
+        if not text or text in translations:
+            continue
+        translations[text] = _lookup_translation((text, language))
+        if translations[text] is None:
+            missing[text] = message
+
+    if missing:
+        payload = {
+            "messages": list(missing.values()),
+            "user_id": user_id,
+            "source": "agent"
+        }
+        response = _invoke_translation_service(payload)
+        translated_messages = response.get("translated_messages")
+        if isinstance(translated_messages, list) and len(translated_messages) == len(missing):
+            language = _learn_language(user_id, response, language)
+            for text, translated in zip(missing, translated_messages):
+                translations[text] = translated
+                if translated is not None:
+                    _store_translation((text, language), translated)
+        else:
+            logger.error("Translation service did not return a batch result, translating the messages one by one")
+            for text, message in missing.items():
+                translations[text] = handle_message_translation(message, user_id)
+
+    results = []
+    for message in messages:
+        translated = translations.get(normalize_text(message))
+        results.append(message if translated is None else translated)
+    return results
+
+
+def translate_card(message, item_list, user_id):
+    """
+    Translates the message and, when the translation service takes batches, the titles of its buttons in one
+    call. Button values are left as they are, since they are what gets sent back to the bot. Returns the
+    translated message.
+    """
+    if not TRANSLATION_BATCH_ENABLED:
+        translated = handle_message_translation(message, user_id) if message else None
+        return message if translated is None else translated
+    translated = handle_batch_translation([message] + [item.get("title", "") for item in item_list], user_id)
+    for item, title in zip(item_list, translated[1:]):
+        if "title" in item:
+            item["title"] = title
+    return translated[0]
+
+
+def resolve_language(user_id):
+    """
+    Returns the language of the user once the mapping or the translation service has reported it.
+    Until then translations are cached per user, for user_language_ttl seconds.
+    """
+    return _user_languages.get(user_id) or f"{USER_KEY_PREFIX}{user_id}"
+
+
+def known_language(user_id):
+    """
+    Returns the language reported for the user within the last user_language_ttl seconds, or None
+    """
+    return _user_languages.get(user_id)
+
+
+def remember_language(user_id, language):
+    _user_languages.put(user_id, language)
+    with _cache_lock:
+        first_seen = language not in _prewarmed_languages
+        _prewarmed_languages.add(language)
+    if first_seen:
+        prewarm_system_messages(language)
+    return language
+
+
+def prewarm_system_messages(language):
+    """
+    Loads the translations of SYSTEM_MESSAGES for the language from the shared tier into the in-memory cache
+    """
+    keys = {_shared_key((normalize_text(message), language)): message for message in SYSTEM_MESSAGES}
+    items = _shared_translations.batch_get(keys, projection="cache_key, translated_message, expires_at")
+    for cache_key, item in items.items():
+        _translation_cache.put((normalize_text(keys[cache_key]), language), item["translated_message"])
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+def get_cache_stats():
+    """
+    Returns the hit/miss counters of the translation cache and its overall hit rate
+    """
+    return _translation_cache.stats()
+
+
+def clear_translation_cache():
+    _translation_cache.clear()
+    _user_languages.clear()
+
+
+def get_shared_translation(key):
+    """
+    Reads the translation from the shared DynamoDB tier, if one is configured
+    """
+    item = _shared_translations.get(_shared_key(key))
+    return item.get("translated_message") if item else None
+
+
+def put_shared_translation(key, translated):
+    ttl = USER_LANGUAGE_TTL if _is_per_user(key) else TRANSLATION_CACHE_TTL
+    _shared_translations.put(_shared_key(key), {
+        "translated_message": translated,
+        "expires_at": int(time.time()) + ttl
+    })
+
+
+def _lookup_translation(key):
+    translated = _translation_cache.get(key, USER_LANGUAGE_TTL if _is_per_user(key) else None)
+    if translated is not None:
+        _translation_cache.count("hits")
+        return translated
+    translated = get_shared_translation(key)
+    if translated is not None:
+        _translation_cache.count("shared_hits")
+        _translation_cache.put(key, translated)
+        return translated
+    _translation_cache.count("misses")
+    return None
+
+
+def _store_translation(key, translated):
+    _translation_cache.put(key, translated)
+    put_shared_translation(key, translated)
+
+
+def _invoke_translation_service(payload):
+    with span("translation", "translate") as sp:
+        response = lambda_client.invoke(FunctionName=os.environ.get("translation_service_arn"),
+                                        InvocationType="RequestResponse",
+                                        Payload=json.dumps(payload))
+        sp.record_aws_response(response)
+        response = json.load(response.get("Payload"))
+    verbose("Response of translation service is: %s", response)
+    return response
+
+
+def _learn_language(user_id, response, language):
+    if response.get("target_language"):
+        return remember_language(user_id, response["target_language"])
+    return language
+
+
+def _is_per_user(key):
+    return key[1].startswith(USER_KEY_PREFIX)
+
+
+def _shared_key(key):
+    text, language = key
+    return f"{language}|{hashlib.sha256(text.encode()).hexdigest()}"
@@ -0,0 +1,127 @@
+import contextvars
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import transcript_helper
+from tracing import span
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+TRANSACT_MAX_ITEMS = 100
+
+_current_buffer = contextvars.ContextVar("write_buffer", default=None)
+
+
+class WriteBuffer:
+    """
+    Gathers the DynamoDB writes of one invocation and flushes them in as few calls as possible:
+    transcript items through BatchWriteItem and mapping attribute updates merged per item.
+    """
+
+    def __init__(self):
+        self.transcript_items = []
+        self.updates = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add_transcript_item(self, item):
+        with self.lock:
+            self.transcript_items.append(item)
+
+    def add_update(self, table, key, attributes):
+        # Later updates of the same attribute on the same item win, like consecutive update_item calls would
+        update_key = (table.name, tuple(sorted(key.items())))
+        with self.lock:
+            _, _, pending = self.updates.setdefault(update_key, (table, key, {}))
+            pending.update(attributes)
+
+    def flush(self):
+        with self.lock:
+            transcript_items, self.transcript_items = self.transcript_items, []
+            updates, self.updates = list(self.updates.values()), OrderedDict()
+        with span("dynamodb", "flush_writes"):
+            if transcript_items:
+                with transcript_helper.transcript_table.batch_writer() as batch:
+                    for item in transcript_items:
+                        batch.put_item(Item=item)
+            if len(updates) == 1:
+                table, key, attributes = updates[0]
+                table.update_item(Key=key, **_update_arguments(attributes))
+            elif updates:
+                _transact_updates(updates)
+        logger.info(f"Flushed {len(transcript_items)} transcript items and {len(updates)} item updates")
+
+
+def current():
+    """
+    Returns the write buffer of the running invocation, or None outside of buffered_writes
+    """
+    return _current_buffer.get()
+
+
+@contextmanager
+def buffered_writes():
+    """
+    Buffers the writes made inside the block and flushes them when it exits, even if it raised,
+    so a failed Teams send does not lose the writes that came before it
+    """
+    buffer = WriteBuffer()
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current_buffer.reset(token)
+        buffer.flush()
+
+
+def append_transcript(message, con_id, agent_name):
+    """
+    Adds a chat message to the invocation's buffer, or stores it straight away when nothing is buffering
+    """
+    buffer = current()
+    if buffer is None:
+        transcript_helper.append_message(message, con_id, agent_name)
+    else:
+        buffer.add_transcript_item(transcript_helper.build_transcript_item(message, con_id, agent_name))
+
+
+def update_attributes(table, key, attributes):
+    """
+    Sets the attributes on the item through the invocation's buffer, or straight away when nothing is buffering
+    """
+    buffer = current()
+    if buffer is None:
+        with span("dynamodb", "update_item"):
+            table.update_item(Key=key, **_update_arguments(attributes))
+    else:
+        buffer.add_update(table, key, attributes)
+
+
+def _update_arguments(attributes):
+    names = {f"#a{index}": name for index, name in enumerate(attributes)}
+    values = {f":v{index}": value for index, value in enumerate(attributes.values())}
+    assignments = ", ".join(f"#a{index}=:v{index}" for index in range(len(attributes)))
+    return {
+        "UpdateExpression": f"set {assignments}",
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values
+    }
+
+
+def _transact_updates(updates):
+    from boto3.dynamodb.types import TypeSerializer
+    serializer = TypeSerializer()
+    for start in range(0, len(updates), TRANSACT_MAX_ITEMS):
+        transact_items = []
+        for table, key, attributes in updates[start:start + TRANSACT_MAX_ITEMS]:
+            arguments = _update_arguments(attributes)
+            transact_items.append({"Update": {
+                "TableName": table.name,
+                "Key": {name: serializer.serialize(value) for name, value in key.items()},
+                "UpdateExpression": arguments["UpdateExpression"],
+                "ExpressionAttributeNames": arguments["ExpressionAttributeNames"],
+                "ExpressionAttributeValues": {name: serializer.serialize(value)
+                                              for name, value in arguments["ExpressionAttributeValues"].items()}
+            }})
+        updates[start][0].meta.client.transact_write_items(TransactItems=transact_items)